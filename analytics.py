@@ -0,0 +1,169 @@
+from catalog_cache import CatalogCache
+from db_config import Cursor
+from jobs import JOBS_BACKEND
+from dotenv import load_dotenv
+import threading
+import logging
+import sys
+import os
+
+load_dotenv()
+
+# Agregados de vendas (vendas_diarias, vendas_produto, vendas_tipo, ver migrations/004_analytics.sql).
+# Cada pedido novo é somado pelo job 'analytics_pedido'; recalcular() reconstrói tudo a partir de pedidos/itens_pedido.
+
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "30"))
+# 0: sem refresh periódico. Com a fila de jobs em memória, um restart perde os pedidos ainda não
+# somados e os agregados ficariam desviados para sempre: nesse caso o padrão é recalcular a cada hora
+ANALYTICS_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_REFRESH_INTERVAL", "3600" if JOBS_BACKEND == 'memory' else "0"))
+ANALYTICS_DIAS = 30
+
+logger = logging.getLogger('soledevita.analytics')
+
+analytics_cache = CatalogCache(ttl=ANALYTICS_CACHE_TTL, max_entries=8, version_poll=0)
+
+# tipo de cada item, conforme a tabela de origem
+_ITENS_COM_TIPO = '''
+    SELECT i.pedido_id, i.itpedidos_origem AS origem, i.produto_id, i.itpedidos_qtde AS qtde,
+           i.itpedidos_qtde * i.itpedidos_precouni AS receita,
+           CASE WHEN i.itpedidos_origem = 'delivery' THEN d.deliv_tipo ELSE p.produto_tipo END AS tipo_id
+    FROM itens_pedido i
+    LEFT JOIN produtos p ON i.itpedidos_origem = 'cardapio' AND p.produto_id = i.produto_id
+    LEFT JOIN produtos_delivery d ON i.itpedidos_origem = 'delivery' AND d.deliv_id = i.produto_id
+'''
+
+
+def registrar_pedido(pedido_id):
+    # Executado pela fila de jobs depois do checkout; idempotente via vendas_pedidos_registrados
+    with Cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO vendas_pedidos_registrados (pedido_id) VALUES (%s)
+            ON CONFLICT (pedido_id) DO NOTHING
+        ''', (pedido_id,))
+        if cursor.rowcount == 0:
+            return
+        _somar_pedido(cursor, pedido_id)
+    analytics_cache.invalidate()
+
+
+def _somar_pedido(cursor, pedido_id):
+    cursor.execute('''
+        INSERT INTO vendas_diarias (dia, pedidos, receita)
+        SELECT pedido_data::date, 1, COALESCE(pedido_prectotal, 0) FROM pedidos WHERE pedido_id = %s
+        ON CONFLICT (dia) DO UPDATE
+        SET pedidos = vendas_diarias.pedidos + 1, receita = vendas_diarias.receita + EXCLUDED.receita
+    ''', (pedido_id,))
+    cursor.execute(f'''
+        WITH itens AS ({_ITENS_COM_TIPO} WHERE i.pedido_id = %s),
+        por_produto AS (
+            INSERT INTO vendas_produto (origem, produto_id, unidades, receita)
+            SELECT origem, produto_id, sum(qtde), sum(receita) FROM itens GROUP BY origem, produto_id
+            ON CONFLICT (origem, produto_id) DO UPDATE
+            SET unidades = vendas_produto.unidades + EXCLUDED.unidades,
+                receita = vendas_produto.receita + EXCLUDED.receita
+        )
+        INSERT INTO vendas_tipo (tipo_id, unidades, receita)
+        SELECT tipo_id, sum(qtde), sum(receita) FROM itens WHERE tipo_id IS NOT NULL GROUP BY tipo_id
+        ON CONFLICT (tipo_id) DO UPDATE
+        SET unidades = vendas_tipo.unidades + EXCLUDED.unidades,
+            receita = vendas_tipo.receita + EXCLUDED.receita
+    ''', (pedido_id,))
+
+
+def recalcular():
+    with Cursor() as cursor:
+        cursor.execute('LOCK TABLE vendas_diarias, vendas_produto, vendas_tipo, vendas_pedidos_registrados '
+                       'IN EXCLUSIVE MODE')
+        cursor.execute('DELETE FROM vendas_diarias')
+        cursor.execute('DELETE FROM vendas_produto')
+        cursor.execute('DELETE FROM vendas_tipo')
+        cursor.execute('DELETE FROM vendas_pedidos_registrados')
+        cursor.execute('INSERT INTO vendas_pedidos_registrados (pedido_id) SELECT pedido_id FROM pedidos')
+        cursor.execute('''
+            INSERT INTO vendas_diarias (dia, pedidos, receita)
+            SELECT pedido_data::date, count(*), COALESCE(sum(pedido_prectotal), 0)
+            FROM pedidos GROUP BY 1
+        ''')
+        cursor.execute(f'''
+            WITH itens AS ({_ITENS_COM_TIPO}),
+            por_produto AS (
+                INSERT INTO vendas_produto (origem, produto_id, unidades, receita)
+                SELECT origem, produto_id, sum(qtde), COALESCE(sum(receita), 0) FROM itens GROUP BY origem, produto_id
+            )
+            INSERT INTO vendas_tipo (tipo_id, unidades, receita)
+            SELECT tipo_id, sum(qtde), COALESCE(sum(receita), 0) FROM itens WHERE tipo_id IS NOT NULL GROUP BY tipo_id
+        ''')
+    analytics_cache.invalidate()
+
+
+def _carregar_resumo():
+    # enche o analytics_cache logo depois do invalidate(): lê do primário, não da réplica
+    with Cursor(readonly=True, replica=False) as cursor:
+        cursor.execute('''
+            SELECT dia, pedidos, receita FROM vendas_diarias
+            WHERE dia > CURRENT_DATE - %s ORDER BY dia
+        ''', (ANALYTICS_DIAS,))
+        diario = [{'dia': dia.isoformat(), 'pedidos': pedidos, 'receita': float(receita)}
+                  for dia, pedidos, receita in cursor.fetchall()]
+
+        cursor.execute('SELECT COALESCE(sum(pedidos), 0), COALESCE(sum(receita), 0) FROM vendas_diarias')
+        total_pedidos, total_receita = cursor.fetchone()
+
+        cursor.execute('''
+            SELECT v.origem, v.produto_id, COALESCE(p.produto_nome, d.deliv_nome), v.unidades, v.receita
+            FROM vendas_produto v
+            LEFT JOIN produtos p ON v.origem = 'cardapio' AND p.produto_id = v.produto_id
+            LEFT JOIN produtos_delivery d ON v.origem = 'delivery' AND d.deliv_id = v.produto_id
+            ORDER BY v.unidades DESC
+            LIMIT 10
+        ''')
+        top_produtos = [{'origem': origem, 'id': pid, 'nome': nome, 'unidades': unidades, 'receita': float(receita)}
+                        for origem, pid, nome, unidades, receita in cursor.fetchall()]
+
+        cursor.execute('''
+            SELECT v.tipo_id, t.tipo_nome, v.unidades, v.receita
+            FROM vendas_tipo v LEFT JOIN tipos t ON t.tipo_id = v.tipo_id
+            ORDER BY v.receita DESC
+        ''')
+        por_tipo = [{'id': tid, 'nome': nome, 'unidades': unidades, 'receita': float(receita)}
+                    for tid, nome, unidades, receita in cursor.fetchall()]
+
+    pedidos_periodo = sum(d['pedidos'] for d in diario)
+    receita_periodo = sum(d['receita'] for d in diario)
+    return {
+        'dias': ANALYTICS_DIAS,
+        'receita_periodo': receita_periodo,
+        'pedidos_periodo': pedidos_periodo,
+        'ticket_medio_periodo': receita_periodo / pedidos_periodo if pedidos_periodo else 0.0,
+        'ticket_medio_geral': float(total_receita) / total_pedidos if total_pedidos else 0.0,
+        'diario': diario,
+        'top_produtos': top_produtos,
+        'por_tipo': por_tipo,
+    }
+
+
+def resumo():
+    return analytics_cache.get_or_load('resumo', _carregar_resumo)
+
+
+def iniciar_refresh_periodico(intervalo=ANALYTICS_REFRESH_INTERVAL):
+    # Reconstrói os agregados de tempos em tempos, corrigindo qualquer desvio do incremental
+    if not intervalo:
+        return None
+    parar = threading.Event()
+
+    def loop():
+        while not parar.wait(intervalo):
+            try:
+                recalcular()
+            except Exception:
+                logger.exception('falha ao recalcular analytics')
+
+    threading.Thread(target=loop, name='analytics-refresh', daemon=True).start()
+    return parar
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['recalcular']:
+        sys.exit('uso: python analytics.py recalcular')
+    recalcular()
@@ -1,14 +1,71 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, abort, Response, \
+    stream_with_context
 from dotenv import load_dotenv
-from datetime import datetime
-from db_config import Cursor
+from datetime import datetime, timedelta
+from db_config import Cursor, init_app
+from catalog_cache import catalog_cache
+import catalogo
+import busca
+from pedidos import itens_json
+import importacao
+import analytics
+from combos import opcoes_delivery, cotar_combo, ComboInvalido, ETAPAS
+from fragment_cache import fragmento, etag_catalogo, pagina_com_etag, precompilar_templates
+from cart_store import cart_store, chave_produto, chave_delivery
+from order_feed import order_feed, notificar_pedido, formatar_evento
+from jobs import job_queue
+from metrics import init_metrics
+from assets import init_assets
+from auth import gerar_hash, verificar_senha, HashOcupado, limite_ip, limite_email, limite_cadastro
+import migrate
+from psycopg2.extras import execute_values
 from functools import wraps
+import queue
+import uuid
+import io
 import os
 
 load_dotenv()
 app = Flask(__name__)
 app.secret_key = os.getenv("SECRET_KEY")
+init_app(app)
+init_metrics(app)
+precompilar_templates(app)
+init_assets(app)
+
+# DB_AUTO_MIGRATE=1 aplica as migrations pendentes ao subir; DB_CHECK_SCHEMA=1 só avisa o que falta.
+# Os dois são opcionais: rodam no import, em cada worker. O normal é `python migrate.py check` no deploy.
+if os.getenv("DB_AUTO_MIGRATE") == "1":
+    migrate.upgrade(saida=app.logger.info)
+elif os.getenv("DB_CHECK_SCHEMA", "0") == "1":
+    for indice, tabela in migrate.indices_faltando().items():
+        app.logger.warning("índice ausente no banco: %s em %s (rode: python migrate.py)", indice, tabela)
+
+analytics.iniciar_refresh_periodico()
+
+
+@job_queue.handler('analytics_pedido')
+def job_analytics_pedido(pedido_id):
+    analytics.registrar_pedido(pedido_id)
+
+
+job_queue.iniciar()
+
+PEDIDOS_POR_PAGINA = 50
+PEDIDOS_POR_PAGINA_MAX = 200
+
+def carrinho_id():
+    # o cookie guarda só o id; as linhas do carrinho ficam no cart_store
+    if 'carrinho_id' not in session:
+        session['carrinho_id'] = uuid.uuid4().hex
+    return session['carrinho_id']
+
+def checkout_token():
+    # um token por carrinho; trocado só quando o pedido é criado, então todo reenvio do mesmo
+    # carrinho (duplo clique, retentativa, outra aba) cai no mesmo pedido
+    if 'checkout_token' not in session:
+        session['checkout_token'] = str(uuid.uuid4())
+    return session['checkout_token']
 
 def login_required(f):
     @wraps(f)
@@ -55,34 +112,22 @@ def admin_login():
 def admin_dashboard():
     return render_template('admin_dashboard.html')
 
+@app.route('/admin/analytics')
+@admin_required
+def admin_analytics():
+    return jsonify(analytics.resumo())
+
 @app.route('/admin/produtos')
 @admin_required
 def admin_produtos():
-    with Cursor() as cursor:
-        cursor.execute('''
-                       SELECT produto_id, produto_nome, produto_preco, produto_desc, produto_tipo, produto_avaliacao
-                       FROM produtos
-                       ''')
-        result = cursor.fetchall()
-
-    produtos = []
-    for row in result:
-        produtos.append({
-            'id': row[0],
-            'nome': row[1],
-            'preco': row[2],
-            'descricao': row[3],
-            'tipo': row[4],
-            'avaliacao': row[5]
-        })
-    return render_template('admin_produtos.html', produtos=produtos)
+    # renderiza dentro do bloco: o template consome o cursor nomeado aos poucos
+    with Cursor(readonly=True) as cursor:
+        return render_template('admin_produtos.html', produtos=catalogo.iterar_produtos(cursor))
 
 @app.route('/admin/produtos/novo', methods=['GET', 'POST'])
 @admin_required
 def admin_novo_produto():
-    with Cursor() as cursor:
-        cursor.execute('SELECT tipo_id, tipo_nome FROM tipos')
-        tipos = [{'id': row[0], 'nome': row[1]} for row in cursor.fetchall()]
+    tipos = catalogo.listar_tipos()
 
     if request.method == 'POST':
         nome = request.form['nome']
@@ -96,8 +141,12 @@ def admin_novo_produto():
                            INSERT INTO produtos (produto_nome, produto_preco, produto_desc, produto_tipo,
                                                  produto_avaliacao)
                            VALUES (%s, %s, %s, %s, %s)
+                           RETURNING produto_id
                            ''', (nome, preco, descricao, tipo, avaliacao))
+            produto_id = cursor.fetchone()[0]
 
+        catalog_cache.invalidate()
+        busca.indice_busca.atualizar(produto_id)
         flash('Produto adicionado com sucesso!')
         return redirect(url_for('admin_produtos'))
     return render_template('admin_novo_produto.html', tipos=tipos)
@@ -105,30 +154,13 @@ def admin_novo_produto():
 @app.route('/admin/produtos/editar/<int:produto_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_editar_produto(produto_id):
-    with Cursor() as cursor:
-        cursor.execute('SELECT tipo_id, tipo_nome FROM tipos')
-        tipos = [{'id': row[0], 'nome': row[1]} for row in cursor.fetchall()]
-
-        cursor.execute('''
-                       SELECT produto_nome, produto_preco, produto_desc, produto_tipo, produto_avaliacao
-                       FROM produtos
-                       WHERE produto_id = %s
-                       ''', (produto_id,))
-        row = cursor.fetchone()
+    tipos = catalogo.listar_tipos()
+    produto = catalogo.buscar_produto(produto_id)
 
-    if not row:
+    if not produto:
         flash('Produto não encontrado.')
         return redirect(url_for('admin_produtos'))
 
-    produto = {
-        'id': produto_id,
-        'nome': row[0],
-        'preco': row[1],
-        'descricao': row[2],
-        'tipo': row[3],
-        'avaliacao': row[4]
-    }
-
     if request.method == 'POST':
         nome = request.form['nome']
         preco = request.form['preco']
@@ -147,6 +179,8 @@ def admin_editar_produto(produto_id):
                            WHERE produto_id = %s
                            ''', (nome, preco, descricao, tipo, avaliacao, produto_id))
 
+        catalog_cache.invalidate()
+        busca.indice_busca.atualizar(produto_id)
         flash('Produto atualizado com sucesso!')
         return redirect(url_for('admin_produtos'))
 
@@ -157,37 +191,21 @@ def admin_editar_produto(produto_id):
 def admin_remover_produto(produto_id):
     with Cursor() as cursor:
         cursor.execute('DELETE FROM produtos WHERE produto_id = %s', (produto_id,))
+    catalog_cache.invalidate()
+    busca.indice_busca.remover(produto_id)
     flash('Produto removido com sucesso!')
     return redirect(url_for('admin_produtos'))
 
 @app.route('/admin/produtos_deliv')
 @admin_required
 def admin_produtosdeliv():
-    with Cursor() as cursor:
-        cursor.execute('''
-                       SELECT deliv_id, deliv_nome, deliv_desc, deliv_preco, deliv_tipo, deliv_avaliacao
-                       FROM produtos_delivery
-                       ''')
-        result = cursor.fetchall()
-
-    produtos_deliv = []
-    for row in result:
-        produtos_deliv.append({
-            'id': row[0],
-            'nome': row[1],
-            'preco': row[3],
-            'descricao': row[2],
-            'tipo': row[4],
-            'avaliacao': row[5]
-        })
-    return render_template('admin_delivprodutos.html', produtos_deliv=produtos_deliv)
+    with Cursor(readonly=True) as cursor:
+        return render_template('admin_delivprodutos.html', produtos_deliv=catalogo.iterar_delivery(cursor))
 
 @app.route('/admin/produtos_deliv/novo', methods=['GET', 'POST'])
 @admin_required
 def admin_novo_deliv_produto():
-    with Cursor() as cursor:
-        cursor.execute('SELECT tipo_id, tipo_nome FROM tipos')
-        tipos = [{'id': row[0], 'nome': row[1]} for row in cursor.fetchall()]
+    tipos = catalogo.listar_tipos()
 
     if request.method == 'POST':
         nome = request.form['nome']
@@ -202,6 +220,7 @@ def admin_novo_deliv_produto():
                            VALUES (%s, %s, %s, %s, %s)
                            ''', (nome, descricao, preco, tipo, avaliacao))
 
+        catalog_cache.invalidate()
         flash('Produto do delivery adicionado com sucesso!')
         return redirect(url_for('admin_produtosdeliv'))
 
@@ -210,29 +229,13 @@ def admin_novo_deliv_produto():
 @app.route('/admin/produtos_deliv/editar/<int:produto_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_editar_produto_deliv(produto_id):
-    with Cursor() as cursor:
-        cursor.execute('''
-                       SELECT deliv_id, deliv_nome, deliv_desc, deliv_preco, deliv_tipo, deliv_avaliacao
-                       FROM produtos_delivery
-                       WHERE deliv_id = %s
-                       ''', (produto_id,))
-        row = cursor.fetchone()
-        cursor.execute('SELECT tipo_id, tipo_nome FROM tipos')
-        tipos = [{'id': row[0], 'nome': row[1]} for row in cursor.fetchall()]
+    produto_deliv = catalogo.buscar_item_delivery(produto_id)
+    tipos = catalogo.listar_tipos()
 
-    if not row:
+    if not produto_deliv:
         flash('Produto não encontrado.')
         return redirect(url_for('admin_produtosdeliv'))
 
-    produto_deliv = {
-        'id': row[0],
-        'nome': row[1],
-        'descricao': row[2],
-        'preco': row[3],
-        'tipo': row[4],
-        'avaliacao': row[5]
-    }
-
     if request.method == 'POST':
         nome = request.form['nome']
         preco = request.form['preco']
@@ -251,6 +254,7 @@ def admin_editar_produto_deliv(produto_id):
                            WHERE deliv_id = %s
                            ''', (nome, descricao, preco, tipo, avaliacao, produto_id))
 
+        catalog_cache.invalidate()
         flash('Produto atualizado com sucesso!')
         return redirect(url_for('admin_produtosdeliv'))
 
@@ -261,17 +265,40 @@ def admin_editar_produto_deliv(produto_id):
 def admin_remover_produto_deliv(produto_id):
     with Cursor() as cursor:
         cursor.execute('DELETE FROM produtos_delivery WHERE deliv_id = %s', (produto_id,))
+    catalog_cache.invalidate()
     flash('Produto removido com sucesso!')
     return redirect(url_for('admin_produtosdeliv'))
 
+@app.route('/admin/catalogo/exportar/<tabela>')
+@admin_required
+def admin_exportar_catalogo(tabela):
+    formato = request.args.get('formato', 'csv')
+    if tabela not in importacao.TABELAS or formato not in ('csv', 'json'):
+        abort(404)
+    extensao, mimetype = ('csv', 'text/csv') if formato == 'csv' else ('ndjson', 'application/x-ndjson')
+    return Response(stream_with_context(importacao.exportar(tabela, formato)), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={tabela}.{extensao}'})
+
+@app.route('/admin/catalogo/importar/<tabela>', methods=['POST'])
+@admin_required
+def admin_importar_catalogo(tabela):
+    arquivo = request.files.get('arquivo')
+    if tabela not in importacao.TABELAS or not arquivo:
+        return jsonify({'erro': 'tabela ou arquivo inválido'}), 400
+    formato = 'json' if arquivo.filename.lower().endswith(('.json', '.ndjson', '.jsonl')) else 'csv'
+    texto = io.TextIOWrapper(arquivo.stream, encoding='utf-8-sig', newline='')
+    try:
+        relatorio = importacao.importar(tabela, texto, formato, simular=request.form.get('simular') == '1')
+    except importacao.ArquivoInvalido as e:
+        return jsonify({'erro': str(e)}), 400
+    if not relatorio['simulacao']:
+        catalog_cache.invalidate()
+    return jsonify(relatorio), 200 if not relatorio['invalidas'] else 207
+
 @app.route('/admin/tipos')
 @admin_required
 def admin_tipos():
-    with Cursor() as cursor:
-        cursor.execute('SELECT tipo_id, tipo_nome FROM tipos')
-        result = cursor.fetchall()
-
-    tipos = [{'id': row[0], 'nome': row[1]} for row in result]
+    tipos = catalogo.listar_tipos()
     return render_template('admin_tipos.html', tipos=tipos)
 
 @app.route('/admin/tipos/novo', methods=['POST'])
@@ -286,7 +313,7 @@ def admin_novo_tipo():
 @app.route('/admin/tipos/editar/<int:tipo_id>', methods=['GET', 'POST'])
 @admin_required
 def admin_editar_tipo(tipo_id):
-    with Cursor() as cursor:
+    with Cursor(readonly=True) as cursor:
         cursor.execute('SELECT tipo_id, tipo_nome FROM tipos WHERE tipo_id = %s', (tipo_id,))
         row = cursor.fetchone()
 
@@ -308,49 +335,115 @@ def admin_editar_tipo(tipo_id):
 @app.route('/delivery')
 @login_required
 def delivery():
-    return redirect(url_for('escolher_massa'))
+    return redirect(url_for('montar_delivery'))
+
+def _adicionar_combo(combo):
+    cart_store.add(carrinho_id(), chave_delivery(combo.massa.id, combo.molho.id, combo.bebida.id),
+                   combo.item_carrinho())
+
+@app.route('/delivery/montar', methods=['GET', 'POST'])
+@login_required
+def montar_delivery():
+    # As três etapas numa página só; o total é calculado no navegador e validado aqui no POST
+    if request.method == 'POST':
+        try:
+            combo = cotar_combo(*(request.form.get(campo) for campo, _ in ETAPAS))
+        except ComboInvalido:
+            flash("Você precisa escolher massa, molho e bebida.")
+            return redirect(url_for('montar_delivery'))
+        _adicionar_combo(combo)
+        flash("Prato adicionado ao carrinho!")
+        return redirect(url_for('carrinho'))
+
+    etag = etag_catalogo('delivery_montar', session.get('usuario_id'), session.get('usuario_nome'))
+
+    def render():
+        etapas = {campo: fragmento('fragmentos/delivery_itens.html', (tipo, campo),
+                                   lambda tipo=tipo: {'itens': opcoes_delivery().get(tipo, [])},
+                                   campo=campo)
+                  for campo, tipo in ETAPAS}
+        return render_template('delivery_montar.html', etapas=etapas)
+
+    return pagina_com_etag(etag, render)
+
+@app.route('/api/cardapio/busca')
+def api_cardapio_busca():
+    # ?q=massa&tipo=1&tipo=5&preco=20-40&avaliacao=4&limite=20
+    try:
+        tipos = [int(t) for t in request.args.getlist('tipo')]
+        nota = request.args.get('avaliacao', type=int)
+    except ValueError:
+        abort(400)
+    limite = min(max(request.args.get('limite', busca.BUSCA_LIMITE, type=int), 1), busca.BUSCA_LIMITE_MAX)
+    return jsonify(busca.buscar(request.args.get('q', ''), tipos, request.args.getlist('preco'), nota, limite))
+
+@app.route('/api/delivery/opcoes')
+def api_delivery_opcoes():
+    etag = etag_catalogo('api_delivery_opcoes')
+
+    def render():
+        opcoes = opcoes_delivery()
+        return jsonify({
+            campo.replace('_id', 's'): [dict(item.as_dict(), preco=float(item.preco))
+                                       for item in opcoes.get(tipo, [])]
+            for campo, tipo in ETAPAS
+        })
+
+    return pagina_com_etag(etag, render)
+
+@app.route('/api/delivery/combo', methods=['GET', 'POST'])
+def api_delivery_combo():
+    dados = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+    try:
+        combo = cotar_combo(*(dados.get(campo) for campo, _ in ETAPAS))
+    except ComboInvalido as e:
+        return jsonify({'valido': False, 'erro': f'{e} inválido'}), 400
+
+    if request.method == 'POST':
+        if 'usuario_id' not in session:
+            return jsonify({'valido': True, 'erro': 'login necessário'}), 401
+        _adicionar_combo(combo)
+        return jsonify(dict(combo.as_dict(), valido=True, adicionado=True))
+
+    return jsonify(dict(combo.as_dict(), valido=True))
+
+def _pagina_delivery(template, tipo, campo):
+    etag = etag_catalogo(template, session.get('usuario_id'), session.get('usuario_nome'))
+
+    def render():
+        itens_html = fragmento('fragmentos/delivery_itens.html', (tipo, campo),
+                               lambda: {'itens': opcoes_delivery().get(tipo, [])},
+                               campo=campo)
+        return render_template(template, itens_html=itens_html)
+
+    return pagina_com_etag(etag, render)
 
 @app.route('/delivery/massa', methods=['GET', 'POST'])
 @login_required
 def escolher_massa():
-    with Cursor() as cursor:
-        cursor.execute(
-            "SELECT deliv_id, deliv_nome, deliv_desc, deliv_preco FROM produtos_delivery WHERE deliv_tipo = 1")
-        massas = [{'id': r[0], 'nome': r[1], 'desc': r[2], 'preco': r[3]} for r in cursor.fetchall()]
-
     if request.method == 'POST':
         session['delivery_massa'] = request.form['massa_id']
         return redirect(url_for('escolher_molho'))
 
-    return render_template('delivery_massa.html', massas=massas)
+    return _pagina_delivery('delivery_massa.html', catalogo.TIPO_MASSA, 'massa_id')
 
 @app.route('/delivery/molho', methods=['GET', 'POST'])
 @login_required
 def escolher_molho():
-    with Cursor() as cursor:
-        cursor.execute(
-            "SELECT deliv_id, deliv_nome, deliv_desc, deliv_preco FROM produtos_delivery WHERE deliv_tipo = 5")
-        molhos = [{'id': r[0], 'nome': r[1], 'desc': r[2], 'preco': r[3]} for r in cursor.fetchall()]
-
     if request.method == 'POST':
         session['delivery_molho'] = request.form['molho_id']
         return redirect(url_for('escolher_bebida'))
 
-    return render_template('delivery_molho.html', molhos=molhos)
+    return _pagina_delivery('delivery_molho.html', catalogo.TIPO_MOLHO, 'molho_id')
 
 @app.route('/delivery/bebida', methods=['GET', 'POST'])
 @login_required
 def escolher_bebida():
-    with Cursor() as cursor:
-        cursor.execute(
-            "SELECT deliv_id, deliv_nome, deliv_desc, deliv_preco FROM produtos_delivery WHERE deliv_tipo = 4")
-        bebidas = [{'id': r[0], 'nome': r[1], 'desc': r[2], 'preco': r[3]} for r in cursor.fetchall()]
-
     if request.method == 'POST':
         session['delivery_bebida'] = request.form['bebida_id']
         return redirect(url_for('confirmar_delivery'))
 
-    return render_template('delivery_bebida.html', bebidas=bebidas)
+    return _pagina_delivery('delivery_bebida.html', catalogo.TIPO_BEBIDA, 'bebida_id')
 
 @app.route('/delivery/confirmar', methods=['GET', 'POST'])
 @login_required
@@ -363,29 +456,18 @@ def confirmar_delivery():
         flash("Você precisa escolher massa, molho e bebida.")
         return redirect(url_for('escolher_massa'))
 
-    with Cursor() as cursor:
-        cursor.execute("SELECT deliv_id, deliv_nome, deliv_preco FROM produtos_delivery WHERE deliv_id IN (%s, %s, %s)",
-                       (massa_id, molho_id, bebida_id))
-        itens = cursor.fetchall()
-
-    total = sum([i[2] for i in itens])
+    try:
+        combo = cotar_combo(massa_id, molho_id, bebida_id)
+    except ComboInvalido:
+        flash("Você precisa escolher massa, molho e bebida.")
+        return redirect(url_for('escolher_massa'))
 
     if request.method == 'POST':
-        carrinho = session.get('carrinho', [])
-        carrinho.append({
-            'tipo': 'delivery',
-            'massa_id': massa_id,
-            'molho_id': molho_id,
-            'bebida_id': bebida_id,
-            'nome': f"Prato Delivery ({itens[0][1]}, {itens[1][1]}, {itens[2][1]})",
-            'preco': total,
-            'quantidade': 1
-        })
-        session['carrinho'] = carrinho
+        _adicionar_combo(combo)
         flash("Prato adicionado ao carrinho!")
         return redirect(url_for('carrinho'))
 
-    return render_template('delivery_confirmar.html', itens=itens, total=total)
+    return render_template('delivery_confirmar.html', itens=combo.itens, total=combo.preco)
 
 @app.route('/admin/tipos/remover/<int:tipo_id>')
 @admin_required
@@ -395,17 +477,64 @@ def admin_remover_tipo(tipo_id):
     flash('Tipo removido com sucesso!')
     return redirect(url_for('admin_tipos'))
 
+def filtros_pedidos(alias):
+    # Lê status, período e o cursor de paginação (?depois=<data>|<id>) da query string
+    condicoes = []
+    params = []
+    filtros = {}
+
+    status = request.args.get('status')
+    if status:
+        condicoes.append(f'{alias}pedido_status = %s')
+        params.append(status)
+        filtros['status'] = status
+
+    try:
+        de = request.args.get('de')
+        if de:
+            condicoes.append(f'{alias}pedido_data >= %s')
+            params.append(datetime.strptime(de, '%Y-%m-%d'))
+            filtros['de'] = de
+        ate = request.args.get('ate')
+        if ate:
+            condicoes.append(f'{alias}pedido_data < %s')
+            params.append(datetime.strptime(ate, '%Y-%m-%d') + timedelta(days=1))
+            filtros['ate'] = ate
+        depois = request.args.get('depois')
+        if depois:
+            data, pedido_id = depois.rsplit('|', 1)
+            condicoes.append(f'({alias}pedido_data, {alias}pedido_id) < (%s, %s)')
+            params.extend([datetime.fromisoformat(data), int(pedido_id)])
+    except ValueError:
+        abort(400)
+
+    limite = min(request.args.get('por_pagina', PEDIDOS_POR_PAGINA, type=int), PEDIDOS_POR_PAGINA_MAX)
+    return condicoes, params, filtros, max(limite, 1)
+
+def proxima_pagina(pedidos, limite):
+    # buscamos limite + 1 linhas: se veio a extra, existe próxima página
+    if len(pedidos) <= limite:
+        return pedidos, None
+    pedidos = pedidos[:limite]
+    ultimo = pedidos[-1]
+    return pedidos, f"{ultimo['data'].isoformat()}|{ultimo['id']}"
+
 @app.route('/admin/pedidos')
 @admin_required
 def admin_pedidos():
-    with Cursor() as cursor:
-        cursor.execute('''
+    condicoes, params, filtros, limite = filtros_pedidos('p.')
+    where = ('WHERE ' + ' AND '.join(condicoes)) if condicoes else ''
+
+    with Cursor(readonly=True) as cursor:
+        cursor.execute(f'''
             SELECT p.pedido_id, u.usuario_nome, p.pedido_status, 
-                   p.pedido_prectotal, p.pedido_endentrega, p.pedido_data
+                   p.pedido_prectotal, p.pedido_endentrega, p.pedido_data, {itens_json('p.')}
             FROM pedidos p
             JOIN usuarios u ON p.usuario_id = u.usuario_id
-            ORDER BY p.pedido_data DESC
-        ''')
+            {where}
+            ORDER BY p.pedido_data DESC, p.pedido_id DESC
+            LIMIT %s
+        ''', params + [limite + 1])
         pedidos = [
             {
                 'id': row[0],
@@ -413,12 +542,36 @@ def admin_pedidos():
                 'status': row[2],
                 'total': row[3],
                 'endereco': row[4],
-                'data': row[5]
+                'data': row[5],
+                'itens': row[6]
             }
             for row in cursor.fetchall()
         ]
 
-    return render_template('admin_pedidos.html', pedidos=pedidos)
+    pedidos, depois = proxima_pagina(pedidos, limite)
+    return render_template('admin_pedidos.html', pedidos=pedidos, filtros=filtros, depois=depois)
+
+@app.route('/admin/pedidos/stream')
+@admin_required
+def admin_pedidos_stream():
+    # Server-Sent Events: o painel recebe só os pedidos novos/alterados
+    fila = order_feed.inscrever()
+
+    def eventos():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    evento = fila.get(timeout=15)
+                except queue.Empty:
+                    yield ': ping\n\n'  # mantém a conexão viva atrás de proxies
+                    continue
+                yield formatar_evento(evento)
+        finally:
+            order_feed.cancelar(fila)
+
+    return Response(stream_with_context(eventos()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/admin/pedidos/finalizar/<int:pedido_id>')
 @admin_required
@@ -426,28 +579,23 @@ def admin_finalizar_pedido(pedido_id):
     with Cursor() as cursor:
         cursor.execute('UPDATE pedidos SET pedido_status = %s WHERE pedido_id = %s',
                        ('Finalizado', pedido_id))
+        notificar_pedido(cursor, pedido_id, 'atualizado')
     flash('Pedido marcado como Finalizado!')
     return redirect(url_for('admin_pedidos'))
 
 @app.route('/cardapio')
 def cardapio():
-    with Cursor() as cursor:
-        cursor.execute('''
-                       SELECT *
-                       FROM produtos
-                       ''')
-        result = cursor.fetchall()
-    produtos = []
-    for row in result:
-        produtos.append({
-            'id': row[0],
-            'nome': row[1],
-            'preco': row[2],
-            'descricao': row[3],
-            'tipo': row[4],
-            'avaliacao': row[5]
-        })
-    return render_template('cardapio.html', produtos=produtos)
+    logado = 'usuario_id' in session
+    etag = etag_catalogo('cardapio', session.get('usuario_id'), session.get('usuario_nome'))
+
+    def render():
+        # a grade é cacheada só em duas versões: com e sem o botão de adicionar ao carrinho
+        grid_html = fragmento('fragmentos/cardapio_grid.html', logado,
+                              lambda: {'produtos': catalog_cache.get_or_load('cardapio', catalogo.listar_produtos)},
+                              logado=logado)
+        return render_template('cardapio.html', grid_html=grid_html)
+
+    return pagina_com_etag(etag, render)
 
 @app.route('/cadastro', methods=['GET', 'POST'])
 def cadastro():
@@ -456,14 +604,23 @@ def cadastro():
         email = request.form['email']
         senha = request.form['senha']
         endereco = request.form['endereco']
-        senha_hash = generate_password_hash(senha)
 
-        with Cursor() as cursor:
-            cursor.execute('SELECT * FROM usuarios WHERE usuario_email = %s', (email,))
+        if limite_cadastro.bloqueado(request.remote_addr):
+            return render_template('cadastro.html', error="Muitas tentativas. Tente novamente em alguns minutos."), 429
+        limite_cadastro.registrar(request.remote_addr)
+
+        with Cursor(readonly=True) as cursor:
+            cursor.execute('SELECT 1 FROM usuarios WHERE usuario_email = %s', (email,))
             if cursor.fetchone():
                 error = "E-mail já cadastrado."
                 return render_template('cadastro.html', error=error)
 
+        try:
+            senha_hash = gerar_hash(senha)
+        except HashOcupado:
+            return render_template('cadastro.html', error="Servidor ocupado. Tente novamente em instantes."), 503
+
+        with Cursor() as cursor:
             cursor.execute('''
                            INSERT INTO usuarios (usuario_nome, usuario_email, usuario_senha, usuario_endereco)
                            VALUES (%s, %s, %s, %s)
@@ -479,8 +636,14 @@ def login():
     if request.method == 'POST':
         email = request.form['email']
         senha = request.form['senha']
+        chave_email = email.strip().lower()
 
-        with Cursor() as cursor:
+        if limite_ip.bloqueado(request.remote_addr) or limite_email.bloqueado(chave_email):
+            flash('Muitas tentativas de login. Tente novamente em alguns minutos.')
+            return render_template('login.html'), 429
+        limite_ip.registrar(request.remote_addr)
+
+        with Cursor(readonly=True) as cursor:
             cursor.execute('''
                            SELECT usuario_id, usuario_nome, usuario_senha
                            FROM usuarios
@@ -488,12 +651,24 @@ def login():
                            ''', (email,))
             usuario = cursor.fetchone()
 
-        if usuario and check_password_hash(usuario[2], senha):
+        try:
+            ok, novo_hash = verificar_senha(senha, usuario[2]) if usuario else (False, None)
+        except HashOcupado:
+            flash('Servidor ocupado. Tente novamente em instantes.')
+            return render_template('login.html'), 503
+
+        if ok:
+            limite_email.resetar(chave_email)
+            if novo_hash:  # hash antigo (bcrypt ou custo menor): regrava no esquema atual
+                with Cursor() as cursor:
+                    cursor.execute('UPDATE usuarios SET usuario_senha = %s WHERE usuario_id = %s',
+                                   (novo_hash, usuario[0]))
             session['usuario_id'] = usuario[0]
             session['usuario_nome'] = usuario[1]
             flash('Login realizado com sucesso!')
             return redirect(url_for('cardapio'))
         else:
+            limite_email.registrar(chave_email)
             flash('Email ou senha inválidos.')
 
     return render_template('login.html')
@@ -501,102 +676,152 @@ def login():
 @app.route('/carrinho/adicionar/<int:produto_id>')
 @login_required
 def adicionar_carrinho(produto_id):
-    with Cursor() as cursor:
-        cursor.execute('SELECT produto_id, produto_nome, produto_preco FROM produtos WHERE produto_id = %s',
-                       (produto_id,))
-        produto = cursor.fetchone()
+    produto = catalogo.buscar_produto(produto_id)
 
     if not produto:
         flash('Produto não encontrado.')
         return redirect(url_for('cardapio'))
 
     item = {
-        'id': produto[0],
-        'nome': produto[1],
-        'preco': float(produto[2]),
-        'quantidade': 1
+        'id': produto.id,
+        'nome': produto.nome,
+        'preco': float(produto.preco)
     }
+    cart_store.add(carrinho_id(), chave_produto(produto.id), item)
 
-    carrinho = session.get('carrinho', [])
-
-    for p in carrinho:
-        if p.get('id') == item['id']:
-            p['quantidade'] += 1
-            break
-    else:
-        carrinho.append(item)
-
-    session['carrinho'] = carrinho
-    flash(f"{produto[1]} adicionado ao carrinho!")
+    flash(f"{produto.nome} adicionado ao carrinho!")
     return redirect(url_for('cardapio'))
 
 @app.route('/carrinho')
 @login_required
 def carrinho():
-    carrinho = session.get('carrinho', [])
+    carrinho = cart_store.get(carrinho_id())
     total = sum(item['preco'] * item['quantidade'] for item in carrinho)
-    return render_template('carrinho.html', carrinho=carrinho, total=total)
+    return render_template('carrinho.html', carrinho=carrinho, total=total, checkout_token=checkout_token())
 
-@app.route('/carrinho/remover/<int:index>')
+@app.route('/carrinho/remover/<chave>')
 @login_required
-def remover_carrinho(index):
-    carrinho = session.get('carrinho', [])
-    if 0 <= index < len(carrinho):
-        carrinho.pop(index)
-    session['carrinho'] = carrinho
+def remover_carrinho(chave):
+    cart_store.remove(carrinho_id(), chave)
     flash('Item removido do carrinho.')
 
     return redirect(url_for('carrinho'))
 
-@app.route('/finalizar-pedido')
+@app.route('/finalizar-pedido', methods=['POST'])
 @login_required
 def finalizar_pedido():
-    carrinho = session.get('carrinho', [])
+    try:
+        token = str(uuid.UUID(request.form.get('checkout_token', '')))
+    except ValueError:
+        abort(400)
+
+    carrinho = cart_store.get(carrinho_id())
+
+    # (origem, id, qtde) de cada linha; o preço vem do banco, não do carrinho na sessão
+    linhas = []
+    for item in carrinho:
+        if item.get('tipo') == 'delivery':
+            for pid in (item['massa_id'], item['molho_id'], item['bebida_id']):
+                linhas.append(('delivery', int(pid), item['quantidade']))
+        else:
+            linhas.append(('cardapio', int(item['id']), item['quantidade']))
+
+    with Cursor() as cursor:
+        cursor.execute('SELECT pedido_id FROM pedidos WHERE pedido_token = %s AND usuario_id = %s',
+                       (token, session['usuario_id']))
+        existente = cursor.fetchone()
+        if existente is None and linhas:
+            # preços atuais das duas tabelas numa query só
+            itens = execute_values(cursor, '''
+                SELECT v.origem, v.produto_id, sum(v.qtde)::int, COALESCE(p.produto_preco, d.deliv_preco)
+                FROM (VALUES %s) AS v (origem, produto_id, qtde)
+                LEFT JOIN produtos p ON v.origem = 'cardapio' AND p.produto_id = v.produto_id
+                LEFT JOIN produtos_delivery d ON v.origem = 'delivery' AND d.deliv_id = v.produto_id
+                GROUP BY 1, 2, 4
+            ''', linhas, page_size=len(linhas), fetch=True)
+            if any(preco is None for _, _, _, preco in itens):
+                flash("Algum item do seu carrinho não está mais disponível. Revise o carrinho.")
+                return redirect(url_for('carrinho'))
+
+            # o índice único em pedido_token decide qual envio concorrente cria o pedido;
+            # os outros esperam o commit dele e caem no ON CONFLICT
+            cursor.execute('''
+                INSERT INTO pedidos (usuario_id, pedido_status, pedido_prectotal, pedido_endentrega, pedido_token)
+                SELECT usuario_id, %s, %s, usuario_endereco, %s
+                FROM usuarios
+                WHERE usuario_id = %s
+                ON CONFLICT (pedido_token) DO NOTHING
+                RETURNING pedido_id
+            ''', (
+                'Em andamento',
+                sum(qtde * preco for _, _, qtde, preco in itens),
+                token,
+                session['usuario_id']
+            ))
+            criado = cursor.fetchone()
+            if criado:
+                pedido_id = criado[0]
+                execute_values(cursor, '''
+                    INSERT INTO itens_pedido (pedido_id, itpedidos_origem, produto_id, itpedidos_qtde, itpedidos_precouni)
+                    VALUES %s
+                ''', itens, template=f"({int(pedido_id)}, %s, %s, %s, %s)", page_size=500)
+                notificar_pedido(cursor, pedido_id, 'novo')
+            else:
+                cursor.execute('SELECT pedido_id FROM pedidos WHERE pedido_token = %s AND usuario_id = %s',
+                               (token, session['usuario_id']))
+                existente = cursor.fetchone()
+                if existente is None:
+                    abort(409)
 
-    if not carrinho:
+    if existente is None and not linhas:
         flash("Seu carrinho está vazio.")
         return redirect(url_for('cardapio'))
 
-    with Cursor() as cursor:
-        cursor.execute("SELECT usuario_endereco FROM usuarios WHERE usuario_id = %s", (session['usuario_id'],))
-        endereco = cursor.fetchone()[0]
-
-        cursor.execute('''
-            INSERT INTO pedidos (usuario_id, pedido_status, pedido_prectotal, pedido_endentrega)
-            VALUES (%s, %s, %s, %s)
-            RETURNING pedido_id
-        ''', (
-            session['usuario_id'],
-            'Em andamento',
-            sum(item['preco'] * item['quantidade'] for item in carrinho),
-            endereco
-        ))
-        pedido_id = cursor.fetchone()[0]
-
-        for item in carrinho:
-            if item.get('tipo') == 'delivery':
-                for pid in (item['massa_id'], item['molho_id'], item['bebida_id']):
-                    cursor.execute('''
-                        INSERT INTO itens_pedido (pedido_id, produto_id, itpedidos_qtde, itpedidos_precouni)
-                        VALUES (%s, %s, %s, (
-                            SELECT deliv_preco FROM produtos_delivery WHERE deliv_id = %s
-                        ))
-                    ''', (pedido_id, pid, 1, pid))
-            else:
-                cursor.execute('''
-                    INSERT INTO itens_pedido (pedido_id, produto_id, itpedidos_qtde, itpedidos_precouni)
-                    VALUES (%s, %s, %s, %s)
-                ''', (pedido_id, item['id'], item['quantidade'], item['preco']))
+    # um formulário antigo (token já usado) não pode esvaziar o carrinho novo
+    if token == session.get('checkout_token'):
+        session.pop('checkout_token')
+        cart_store.clear(carrinho_id())
+    if existente:
+        flash("Este pedido já foi registrado. Acesse seu perfil para acompanhá-lo.")
+        return redirect(url_for('perfil_pedidos'))
 
-    session['carrinho'] = []
+    # agregados de vendas fora do request: o pedido já está gravado, o job só soma
+    job_queue.enfileirar('analytics_pedido', {'pedido_id': pedido_id}, f'analytics:{pedido_id}')
     flash("Pedido finalizado com sucesso! Acesse seu perfil para ver os pedidos")
 
     return redirect(url_for('perfil_pedidos'))
 
+@app.route('/api/pedidos/<int:pedido_id>')
+def api_pedido(pedido_id):
+    # cabeçalho e itens numa query; o cliente só vê os próprios pedidos, o admin vê todos
+    admin = bool(session.get('admin_autenticado'))
+    if not admin and 'usuario_id' not in session:
+        abort(401)
+
+    with Cursor(readonly=True) as cursor:
+        cursor.execute(f'''
+            SELECT p.pedido_id, p.usuario_id, p.pedido_status, p.pedido_prectotal,
+                   p.pedido_endentrega, p.pedido_data, {itens_json('p.')}
+            FROM pedidos p
+            WHERE p.pedido_id = %s
+        ''', (pedido_id,))
+        row = cursor.fetchone()
+
+    if row is None or (not admin and row[1] != session['usuario_id']):
+        abort(404)
+    return jsonify({
+        'id': row[0],
+        'status': row[2],
+        'total': float(row[3] or 0),
+        'endereco': row[4],
+        'data': row[5].isoformat() if row[5] else None,
+        'itens': row[6]
+    })
+
 @app.route('/perfil', methods=['GET', 'POST'])
 @login_required
 def perfil():
-    with Cursor() as cursor:
+    with Cursor(readonly=True) as cursor:
         cursor.execute("SELECT usuario_nome, usuario_email, usuario_endereco FROM usuarios WHERE usuario_id = %s",
                        (session['usuario_id'],))
         usuario = cursor.fetchone()
@@ -607,13 +832,19 @@ def perfil():
         endereco = request.form['endereco']
         senha = request.form.get('senha')
 
+        try:
+            senha_hash = gerar_hash(senha) if senha else None
+        except HashOcupado:
+            flash("Servidor ocupado. Tente novamente em instantes.")
+            return render_template('perfil.html', usuario=usuario), 503
+
         with Cursor() as cursor:
-            if senha:  # só atualiza senha se o usuário digitou
+            if senha_hash:  # só atualiza senha se o usuário digitou
                 cursor.execute('''
                     UPDATE usuarios
-                    SET usuario_nome = %s, usuario_email = %s, usuario_endereco = %s, usuario_senha = crypt(%s, gen_salt('bf'))
+                    SET usuario_nome = %s, usuario_email = %s, usuario_endereco = %s, usuario_senha = %s
                     WHERE usuario_id = %s
-                ''', (nome, email, endereco, senha, session['usuario_id']))
+                ''', (nome, email, endereco, senha_hash, session['usuario_id']))
             else:
                 cursor.execute('''
                     UPDATE usuarios
@@ -626,31 +857,48 @@ def perfil():
 
     return render_template('perfil.html', usuario=usuario)
 
+def consulta_perfil_pedidos():
+    # SQL e parâmetros da listagem do perfil; usada também pela versão async (asgi.py)
+    condicoes, params, filtros, limite = filtros_pedidos('')
+    condicoes.insert(0, 'usuario_id = %s')
+    params.insert(0, session['usuario_id'])
+    sql = f'''
+        SELECT pedido_id, pedido_status, pedido_prectotal, pedido_endentrega, pedido_data, {itens_json()}
+        FROM pedidos
+        WHERE {' AND '.join(condicoes)}
+        ORDER BY pedido_data DESC, pedido_id DESC
+        LIMIT %s
+    '''
+    return sql, params + [limite + 1], filtros, limite
+
+def render_perfil_pedidos(rows, filtros, limite):
+    pedidos = [
+        {
+            'id': row[0],
+            'status': row[1],
+            'total': row[2] or 0,
+            'endereco': row[3],
+            'data': row[4],
+            'itens': row[5]
+        }
+        for row in rows
+    ]
+    pedidos, depois = proxima_pagina(pedidos, limite)
+    return render_template('perfil_pedidos.html', pedidos=pedidos, filtros=filtros, depois=depois)
+
 @app.route('/perfil/pedidos')
 @login_required
 def perfil_pedidos():
-    with Cursor() as cursor:
-        cursor.execute('''
-            SELECT pedido_id, pedido_status, pedido_prectotal, pedido_endentrega, pedido_data
-            FROM pedidos
-            WHERE usuario_id = %s
-            ORDER BY pedido_data DESC
-        ''', (session['usuario_id'],))
-        pedidos = [
-            {
-                'id': row[0],
-                'status': row[1],
-                'total': row[2] or 0,
-                'endereco': row[3],
-                'data': row[4]
-            }
-            for row in cursor.fetchall()
-        ]
-
-    return render_template('perfil_pedidos.html', pedidos=pedidos)
+    sql, params, filtros, limite = consulta_perfil_pedidos()
+    with Cursor(readonly=True) as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return render_perfil_pedidos(rows, filtros, limite)
 
 @app.route('/logout')
 def logout():
+    if 'carrinho_id' in session:
+        cart_store.clear(session['carrinho_id'])
     session.clear()
     flash('Logout realizado com sucesso.')
     return redirect(url_for('login'))
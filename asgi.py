@@ -0,0 +1,273 @@
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.exceptions import HTTPException
+from catalog_cache import catalog_cache
+from order_feed import order_feed_async, formatar_evento
+from app import app, login_required, admin_required, consulta_perfil_pedidos, render_perfil_pedidos
+from dotenv import load_dotenv
+import contextvars
+import db_async
+import catalogo
+import asyncio
+import sys
+import io
+import os
+
+load_dotenv()
+
+# Modo ASGI (SERVE_MODE=asgi em serve.py, ou: uvicorn asgi:application).
+#
+# Os caminhos quentes de leitura rodam no event loop: o dado vem do pool assíncrono (db_async)
+# e a página é renderizada pela mesma view/template do Flask, dentro do mesmo request context
+# (sessão, flash, before/after_request). O feed de pedidos vira uma corrotina por painel em vez
+# de uma thread. Todo o resto (POSTs, admin, checkout) é o app WSGI de sempre, num pool de threads.
+#
+# No event loop só roda o que é await no pool assíncrono. Código síncrono que pode ir à rede
+# (cache compartilhado, poll de versão do catálogo, carrinho no postgres via context processor,
+# a view e o template do Flask) vai para o executor com _sincrono, dentro do mesmo request context.
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", os.getenv("DB_POOL_MAX", "10")))
+
+_executor = ThreadPoolExecutor(max_workers=ASGI_THREADS, thread_name_prefix='wsgi')
+
+
+class Transmissao:
+    """Resposta em streaming de uma view async: headers + gerador assíncrono de texto."""
+
+    def __init__(self, corpo, mimetype, headers):
+        self.corpo = corpo
+        self.headers = [('Content-Type', mimetype)] + list(headers.items())
+
+
+async def _sincrono(fn, *args):
+    # copy_context leva junto o request context (contextvars) para a thread do executor
+    contexto = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(_executor, contexto.run, fn, *args)
+
+
+async def _aquecer(chave, carregar):
+    # Garante o dado no catalog_cache com a query no pool assíncrono; get() é só memória local
+    if catalog_cache.get(chave) is None:
+        async with db_async.Cursor(readonly=True, replica=False) as cursor:
+            valor = await carregar(cursor)
+        await _sincrono(catalog_cache.get_or_load, chave, lambda: valor)
+
+
+async def cardapio():
+    await _aquecer('cardapio', catalogo.listar_produtos_async)
+    return await _sincrono(app.view_functions['cardapio'])
+
+
+def _pagina_delivery(endpoint):
+    async def view():
+        await _aquecer('delivery', catalogo.delivery_por_tipo_async)
+        return await _sincrono(app.view_functions[endpoint])
+    return view
+
+
+@login_required
+async def perfil_pedidos():
+    sql, params, filtros, limite = consulta_perfil_pedidos()
+    async with db_async.Cursor(readonly=True) as cursor:
+        await cursor.execute(sql, params)
+        rows = await cursor.fetchall()
+    return await _sincrono(render_perfil_pedidos, rows, filtros, limite)
+
+
+@admin_required
+async def admin_pedidos_stream():
+    fila = order_feed_async.inscrever()
+
+    async def eventos():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    evento = await asyncio.wait_for(fila.get(), 15)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                yield formatar_evento(evento)
+        finally:
+            order_feed_async.cancelar(fila)
+
+    return Transmissao(eventos(), 'text/event-stream', {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# endpoint do Flask -> view async, só para GET; o resto cai no WSGI
+VIEWS_ASYNC = {
+    'cardapio': cardapio,
+    'montar_delivery': _pagina_delivery('montar_delivery'),
+    'escolher_massa': _pagina_delivery('escolher_massa'),
+    'escolher_molho': _pagina_delivery('escolher_molho'),
+    'escolher_bebida': _pagina_delivery('escolher_bebida'),
+    'perfil_pedidos': perfil_pedidos,
+    'admin_pedidos_stream': admin_pedidos_stream,
+}
+
+
+class _Entrada(io.RawIOBase):
+    """wsgi.input que puxa o corpo do receive() do ASGI conforme o app lê: nada fica acumulado."""
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._fim = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, destino):
+        # roda na thread do executor; cada mensagem é pedida ao event loop
+        while not self._buffer and not self._fim:
+            mensagem = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if mensagem['type'] == 'http.disconnect':
+                self._fim = True
+                break
+            self._buffer = mensagem.get('body', b'')
+            self._fim = not mensagem.get('more_body')
+        n = min(len(destino), len(self._buffer))
+        destino[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def _environ(scope, entrada=None):
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': entrada if entrada is not None else io.BytesIO(),
+        'wsgi.input_terminated': True,  # corpo chunked (sem Content-Length) termina no EOF da entrada
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    servidor = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = servidor[0], str(servidor[1])
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    for nome, valor in scope['headers']:
+        nome = nome.decode('latin-1').upper().replace('-', '_')
+        valor = valor.decode('latin-1')
+        if nome not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            nome = 'HTTP_' + nome
+        environ[nome] = environ[nome] + ',' + valor if nome in environ else valor
+    return environ
+
+
+def _headers(pares):
+    return [(nome.lower().encode('latin-1'), valor.encode('latin-1')) for nome, valor in pares]
+
+
+async def _esperar_desconexao(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _transmitir(receive, send, transmissao):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': _headers(transmissao.headers)})
+    desconectou = asyncio.ensure_future(_esperar_desconexao(receive))
+    try:
+        async for pedaco in transmissao.corpo:
+            if desconectou.done():
+                break
+            await send({'type': 'http.response.body', 'body': pedaco.encode('utf-8'), 'more_body': True})
+    finally:
+        desconectou.cancel()
+        await transmissao.corpo.aclose()
+
+
+async def _view_async(scope, receive, send, view, argumentos):
+    # o mesmo ciclo do Flask.wsgi_app/full_dispatch_request, com a view aguardada no meio
+    transmissao = None
+    with app.request_context(_environ(scope)):
+        try:
+            try:
+                rv = await _sincrono(app.preprocess_request)
+                if rv is None:
+                    rv = view(**argumentos)
+                    if asyncio.iscoroutine(rv):
+                        rv = await rv
+            except Exception as e:
+                rv = await _sincrono(app.handle_user_exception, e)
+            if isinstance(rv, Transmissao):
+                transmissao = rv
+            else:
+                resposta = await _sincrono(app.finalize_request, rv)
+        except Exception as e:
+            resposta = await _sincrono(app.handle_exception, e)
+    if transmissao is not None:
+        await _transmitir(receive, send, transmissao)
+        return
+    await send({'type': 'http.response.start', 'status': resposta.status_code,
+                'headers': _headers(resposta.headers.items())})
+    await send({'type': 'http.response.body', 'body': resposta.get_data()})
+
+
+async def _wsgi(scope, receive, send):
+    # App WSGI numa thread do executor. O corpo da requisição chega sob demanda (upload da importação
+    # não fica inteiro na memória) e o da resposta sai pedaço a pedaço (exportação em streaming)
+    loop = asyncio.get_running_loop()
+    inicio = {}
+
+    def start_response(status, headers, exc_info=None):
+        inicio['status'] = int(status.split(' ', 1)[0])
+        inicio['headers'] = headers
+
+    # Um contexto por requisição para todas as chamadas no executor: o stream_with_context empurra o
+    # request context no primeiro pedaço e o tira no close(), e cada pedaço pode cair numa thread
+    # diferente do pool. Sem isso o contexto fica preso na primeira thread e o pop() falha.
+    contexto = contextvars.copy_context()
+
+    def executar(fn, *args):
+        return loop.run_in_executor(_executor, contexto.run, fn, *args)
+
+    entrada = io.BufferedReader(_Entrada(receive, loop))
+    resultado = await executar(app.wsgi_app, _environ(scope, entrada), start_response)
+    try:
+        iterador = await executar(iter, resultado)
+        await send({'type': 'http.response.start', 'status': inicio['status'], 'headers': _headers(inicio['headers'])})
+        while True:
+            pedaco = await executar(next, iterador, None)
+            if pedaco is None:
+                break
+            await send({'type': 'http.response.body', 'body': pedaco, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(resultado, 'close'):
+            await executar(resultado.close)
+
+
+async def _lifespan(receive, send):
+    while True:
+        mensagem = await receive()
+        if mensagem['type'] == 'lifespan.startup':
+            await db_async.abrir()
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensagem['type'] == 'lifespan.shutdown':
+            await db_async.fechar()
+            _executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] == 'GET':
+        try:
+            endpoint, argumentos = app.url_map.bind_to_environ(_environ(scope)).match()
+        except HTTPException:
+            endpoint = None
+        if endpoint in VIEWS_ASYNC:
+            return await _view_async(scope, receive, send, VIEWS_ASYNC[endpoint], argumentos)
+    return await _wsgi(scope, receive, send)
@@ -0,0 +1,116 @@
+from flask import request, send_from_directory, abort
+from dotenv import load_dotenv
+import mimetypes
+import hashlib
+import threading
+import json
+import gzip
+import sys
+import os
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional: sem ele só geramos .gz
+    brotli = None
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST = 'dist'
+DIST_DIR = os.path.join(STATIC_DIR, DIST)
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+COMPRIMIVEIS = ('.css', '.js', '.svg', '.html', '.json', '.txt')
+UM_ANO = 365 * 24 * 3600
+
+
+def _nome_com_hash(caminho, conteudo):
+    base, ext = os.path.splitext(caminho)
+    return f'{base}.{hashlib.sha256(conteudo).hexdigest()[:10]}{ext}'
+
+
+def build(saida=print):
+    # Copia static/ para static/dist/ com hash no nome + variantes .gz/.br, e grava o manifest.
+    # Nada é apagado nem trocado de lugar: os arquivos novos entram ao lado dos anteriores (conteúdo
+    # diferente, nome diferente) e o manifest é substituído por último, com os.replace. dist/ nunca
+    # some e o manifest nunca aponta para um arquivo que ainda não existe, mesmo com vários processos
+    # rodando build() ao mesmo tempo. Versões antigas ficam para páginas já renderizadas.
+    manifest = {}
+    for raiz, dirs, arquivos in os.walk(STATIC_DIR):
+        if raiz == STATIC_DIR:
+            dirs[:] = [d for d in dirs if d != DIST]
+        for nome in sorted(arquivos):
+            origem = os.path.join(raiz, nome)
+            relativo = os.path.relpath(origem, STATIC_DIR).replace(os.sep, '/')
+            with open(origem, 'rb') as f:
+                conteudo = f.read()
+            destino_rel = _nome_com_hash(relativo, conteudo)
+            destino = os.path.join(DIST_DIR, destino_rel)
+            if not os.path.isfile(destino):
+                os.makedirs(os.path.dirname(destino), exist_ok=True)
+                if destino.endswith(COMPRIMIVEIS):
+                    _gravar(destino + '.gz', gzip.compress(conteudo, 9, mtime=0))
+                    if brotli is not None:
+                        _gravar(destino + '.br', brotli.compress(conteudo, quality=11))
+                _gravar(destino, conteudo)  # por último: existir o arquivo base quer dizer que as variantes existem
+            manifest[relativo] = f'{DIST}/{destino_rel}'
+            saida(f'{relativo} -> {manifest[relativo]}')
+    _gravar(MANIFEST, json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def _gravar(caminho, conteudo):
+    # escreve num temporário do próprio processo/thread e troca de uma vez: quem lê vê o arquivo
+    # inteiro ou nada
+    temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporario, 'wb') as f:
+        f.write(conteudo)
+    os.replace(temporario, caminho)
+
+
+def _carregar_manifest():
+    try:
+        with open(MANIFEST, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def servir_dist(filename):
+    # Arquivos com hash nunca mudam: cache imutável e variante pré-comprimida quando o cliente aceita
+    aceita = request.accept_encodings
+    tipo = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for ext, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+        if aceita[encoding] and os.path.isfile(os.path.join(DIST_DIR, filename + ext)):
+            resp = send_from_directory(DIST_DIR, filename + ext, mimetype=tipo, max_age=UM_ANO)
+            resp.headers['Content-Encoding'] = encoding
+            break
+    else:
+        if not os.path.isfile(os.path.join(DIST_DIR, filename)):
+            abort(404)
+        resp = send_from_directory(DIST_DIR, filename, mimetype=tipo, max_age=UM_ANO)
+    resp.headers['Cache-Control'] = f'public, max-age={UM_ANO}, immutable'
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+def init_assets(app):
+    if os.getenv("ASSETS_AUTO_BUILD") == "1":
+        build(saida=app.logger.debug)
+    manifest = _carregar_manifest()
+    # entra no ETag das páginas (fragment_cache): um deploy com CSS/JS novos não recebe 304
+    app.config['ASSETS_VERSION'] = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:12]
+    # send_file usa wsgi.file_wrapper (sendfile no gunicorn); USE_X_SENDFILE=1 delega ao nginx/apache
+    app.config['USE_X_SENDFILE'] = os.getenv("USE_X_SENDFILE") == "1"
+    app.add_url_rule(f'{app.static_url_path}/{DIST}/<path:filename>', 'static_dist', servir_dist)
+
+    @app.url_defaults
+    def _static_com_hash(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            values['filename'] = manifest[values['filename']]
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] not in ([], ['build']):
+        sys.exit('uso: python assets.py [build]')
+    build()
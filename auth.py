@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+from collections import deque
+from db_config import Cursor
+from shared_cache import shared_cache, StoreIndisponivel
+from dotenv import load_dotenv
+import threading
+import logging
+import time
+import os
+
+load_dotenv()
+
+# Esquema único de senha: o formato do werkzeug ("metodo$salt$hash").
+# Hashes antigos (bcrypt do pgcrypto, gravados pelo /perfil) são migrados no próximo login.
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_MAX = int(os.getenv("HASH_QUEUE_MAX", "32"))  # hashes em andamento + na fila
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "10"))
+
+LOGIN_JANELA = float(os.getenv("LOGIN_JANELA", "300"))  # segundos
+LOGIN_MAX_POR_IP = int(os.getenv("LOGIN_MAX_POR_IP", "30"))
+LOGIN_MAX_POR_EMAIL = int(os.getenv("LOGIN_MAX_POR_EMAIL", "5"))
+CADASTRO_MAX_POR_IP = int(os.getenv("CADASTRO_MAX_POR_IP", "10"))  # cadastros por IP na mesma janela
+
+logger = logging.getLogger('soledevita.auth')
+
+
+class HashOcupado(Exception):
+    pass
+
+
+class _HashExecutor:
+    """Limita quantos hashes caros rodam ao mesmo tempo, sem prender todas as threads do servidor."""
+
+    def __init__(self, workers=HASH_WORKERS, fila_max=HASH_QUEUE_MAX, timeout=HASH_TIMEOUT):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash')
+        self._vagas = threading.BoundedSemaphore(fila_max)
+        self.timeout = timeout
+
+    def run(self, fn, *args):
+        if not self._vagas.acquire(blocking=False):
+            raise HashOcupado()
+        try:
+            futuro = self._executor.submit(fn, *args)
+        except BaseException:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeout:
+            # fila cheia demais para terminar a tempo: mesma resposta de quando não há vaga
+            futuro.cancel()
+            raise HashOcupado()
+
+
+_hash_executor = _HashExecutor()
+
+
+def gerar_hash(senha):
+    return _hash_executor.run(generate_password_hash, senha, PASSWORD_HASH_METHOD)
+
+
+def _precisa_rehash(hash_salvo):
+    return hash_salvo.split('$', 1)[0] != PASSWORD_HASH_METHOD
+
+
+def _verificar_bcrypt(senha, hash_salvo):
+    with Cursor(readonly=True) as cursor:
+        cursor.execute('SELECT crypt(%s, %s) = %s', (senha, hash_salvo, hash_salvo))
+        return cursor.fetchone()[0]
+
+
+def verificar_senha(senha, hash_salvo):
+    # Retorna (ok, novo_hash); novo_hash vem preenchido quando o hash salvo está em esquema/custo antigo
+    if not hash_salvo:
+        return False, None
+    if hash_salvo.startswith(('$2a$', '$2b$', '$2y$')):
+        ok = _verificar_bcrypt(senha, hash_salvo)
+    else:
+        ok = _hash_executor.run(check_password_hash, hash_salvo, senha)
+    if ok and (hash_salvo.startswith('$') or _precisa_rehash(hash_salvo)):
+        try:
+            return True, gerar_hash(senha)
+        except HashOcupado:
+            # a senha já conferiu: entra agora e migra o hash num próximo login
+            logger.info('rehash adiado: executor de hash ocupado')
+    return ok, None
+
+
+class RateLimiter:
+    """Janela deslizante em memória: no máximo `limite` eventos por chave a cada `janela` segundos."""
+
+    def __init__(self, limite, janela=LOGIN_JANELA):
+        self.limite = limite
+        self.janela = janela
+        self._lock = threading.Lock()
+        self._eventos = {}
+        self._proxima_limpeza = time.monotonic() + janela
+
+    def _limpar(self, agora):
+        if agora < self._proxima_limpeza:
+            return
+        self._proxima_limpeza = agora + self.janela
+        corte = agora - self.janela
+        for chave in [c for c, ev in self._eventos.items() if not ev or ev[-1] < corte]:
+            del self._eventos[chave]
+
+    def bloqueado(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            eventos = self._eventos.get(chave)
+            if not eventos:
+                return False
+            while eventos and eventos[0] < agora - self.janela:
+                eventos.popleft()
+            return len(eventos) >= self.limite
+
+    def registrar(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            self._limpar(agora)
+            self._eventos.setdefault(chave, deque()).append(agora)
+
+    def resetar(self, chave):
+        with self._lock:
+            self._eventos.pop(chave, None)
+
+
+class SharedRateLimiter:
+    """Mesma interface, contada no cache compartilhado: o limite vale para todos os nós juntos.
+
+    Janela fixa (um contador por janela) em vez de deslizante; se o store cair, conta só neste processo.
+    """
+
+    def __init__(self, nome, limite, janela=LOGIN_JANELA, cache=shared_cache):
+        self.namespace = 'ratelimit:' + nome
+        self.limite = limite
+        self.janela = janela
+        self.cache = cache
+        self._local = RateLimiter(limite, janela)
+
+    def _chave(self, chave):
+        return f'{chave}:{int(time.time() // self.janela)}'
+
+    def bloqueado(self, chave):
+        # contador lido direto do store, sem o LRU local
+        completa = self.cache.chave(self.namespace, self._chave(chave))
+        try:
+            return self.cache.store.get_many([completa]).get(completa, 0) >= self.limite
+        except StoreIndisponivel:
+            return self._local.bloqueado(chave)
+
+    def registrar(self, chave):
+        try:
+            self.cache.incr(self.namespace, self._chave(chave), self.janela)
+        except StoreIndisponivel:
+            self._local.registrar(chave)
+
+    def resetar(self, chave):
+        self.cache.delete(self.namespace, self._chave(chave))
+        self._local.resetar(chave)
+
+
+def _rate_limiter(nome, limite):
+    if shared_cache.distribuido:
+        return SharedRateLimiter(nome, limite)
+    return RateLimiter(limite)
+
+
+limite_ip = _rate_limiter('ip', LOGIN_MAX_POR_IP)
+limite_email = _rate_limiter('email', LOGIN_MAX_POR_EMAIL)
+limite_cadastro = _rate_limiter('cadastro', CADASTRO_MAX_POR_IP)  # separado: cadastro não gasta tentativas de login
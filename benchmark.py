@@ -0,0 +1,252 @@
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash
+from db_config import Cursor, DBNAME
+import subprocess
+import threading
+import argparse
+import platform
+import metrics
+import random
+import json
+import time
+import re
+import sys
+import os
+
+# Carga sintética para comparar commits:
+#   python benchmark.py --seed --usuarios 8 --duracao 30 --saida bench.json
+# Roda a app Flask em processo (test_client) contra o Postgres configurado no .env.
+
+SENHA_BENCH = 'bench123'
+TIPO_MASSA, TIPO_BEBIDA, TIPO_MOLHO = 1, 4, 5
+
+
+def semear(produtos, usuarios, pedidos):
+    senha_hash = generate_password_hash(SENHA_BENCH)  # caro de propósito: calcula uma vez só
+    with Cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO tipos (tipo_id, tipo_nome)
+            VALUES (1, 'Massa'), (2, 'Prato'), (3, 'Sobremesa'), (4, 'Bebida'), (5, 'Molho')
+            ON CONFLICT (tipo_id) DO NOTHING
+        ''')
+        cursor.execute("SELECT setval(pg_get_serial_sequence('tipos', 'tipo_id'), (SELECT max(tipo_id) FROM tipos))")
+        cursor.execute('''
+            INSERT INTO produtos (produto_nome, produto_preco, produto_desc, produto_tipo, produto_avaliacao)
+            SELECT 'Bench prato ' || i, round((10 + random() * 80)::numeric, 2),
+                   'Descrição do prato ' || i, 1 + i % 3, round((1 + random() * 4)::numeric, 1)
+            FROM generate_series(1, %s) i
+        ''', (produtos,))
+        cursor.execute('''
+            INSERT INTO produtos_delivery (deliv_nome, deliv_desc, deliv_preco, deliv_tipo, deliv_avaliacao)
+            SELECT 'Bench item ' || i, 'Item de delivery ' || i, round((5 + random() * 30)::numeric, 2),
+                   (ARRAY[1, 4, 5])[1 + i % 3], round((1 + random() * 4)::numeric, 1)
+            FROM generate_series(1, %s) i
+        ''', (max(produtos // 2, 6),))
+        cursor.execute('''
+            INSERT INTO usuarios (usuario_nome, usuario_email, usuario_senha, usuario_endereco)
+            SELECT 'Bench ' || i, 'bench' || i || '@bench.local', %s, 'Rua do Benchmark, ' || i
+            FROM generate_series(1, %s) i
+            ON CONFLICT (usuario_email) DO NOTHING
+        ''', (senha_hash, usuarios))
+        cursor.execute('''
+            INSERT INTO pedidos (usuario_id, pedido_status, pedido_prectotal, pedido_endentrega, pedido_data)
+            SELECT u.usuario_id, CASE WHEN random() < 0.8 THEN 'Finalizado' ELSE 'Em andamento' END,
+                   round((20 + random() * 200)::numeric, 2), u.usuario_endereco,
+                   now() - random() * interval '365 days'
+            FROM generate_series(1, %s) i
+            JOIN LATERAL (
+                SELECT usuario_id, usuario_endereco FROM usuarios
+                WHERE usuario_email LIKE 'bench%%@bench.local'
+                OFFSET (i %% %s) LIMIT 1
+            ) u ON true
+        ''', (pedidos, usuarios))
+        cursor.execute('''
+            INSERT INTO itens_pedido (pedido_id, produto_id, itpedidos_qtde, itpedidos_precouni)
+            SELECT p.pedido_id, pr.produto_id, 1 + (random() * 3)::int, pr.produto_preco
+            FROM pedidos p
+            JOIN LATERAL (SELECT produto_id, produto_preco FROM produtos ORDER BY random() LIMIT 3) pr ON true
+            WHERE NOT EXISTS (SELECT 1 FROM itens_pedido i WHERE i.pedido_id = p.pedido_id)
+        ''')
+
+
+class Resultados:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.amostras = {}  # passo -> [latências em s]
+        self.erros = {}
+
+    def registrar(self, passo, duracao, ok):
+        with self._lock:
+            self.amostras.setdefault(passo, []).append(duracao)
+            if not ok:
+                self.erros[passo] = self.erros.get(passo, 0) + 1
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[k]
+
+
+def _queries_por_endpoint():
+    # soma e contagem do histograma de queries por request, por endpoint
+    with metrics._lock:
+        return {dict(key)['endpoint']: (serie[-2], serie[-1])
+                for key, serie in metrics.request_queries._series.items()}
+
+
+def _passo(client, resultados, nome, metodo, url, esperado=None, **kwargs):
+    # esperado: confere a resposta além do status (ex.: para onde o redirect aponta)
+    inicio = time.perf_counter()
+    resp = getattr(client, metodo)(url, **kwargs)
+    duracao = time.perf_counter() - inicio
+    resultados.registrar(nome, duracao, resp.status_code < 400 and (esperado is None or esperado(resp)))
+    return resp
+
+
+_CHECKOUT_TOKEN = re.compile(r'name="checkout_token" value="([^"]+)"')
+
+
+def fluxo_cliente(app, resultados, n_usuario, ids_produtos, ids_delivery, fim):
+    client = app.test_client()
+    # um IP por cliente simulado, como na vida real: senão todos os logins caem no mesmo
+    # limite_ip (LOGIN_MAX_POR_IP) e o benchmark inteiro toma 429 acima de 30 usuários
+    client.environ_base['REMOTE_ADDR'] = f'10.{n_usuario >> 16 & 255}.{n_usuario >> 8 & 255}.{n_usuario & 255}'
+    _passo(client, resultados, 'login', 'post', '/login',
+           data={'email': f'bench{n_usuario}@bench.local', 'senha': SENHA_BENCH})
+    while time.monotonic() < fim:
+        _passo(client, resultados, 'cardapio', 'get', '/cardapio')
+        for _ in range(random.randint(1, 3)):
+            _passo(client, resultados, 'adicionar_carrinho', 'get',
+                   f'/carrinho/adicionar/{random.choice(ids_produtos)}')
+        _passo(client, resultados, 'delivery_massa', 'post', '/delivery/massa',
+               data={'massa_id': random.choice(ids_delivery[TIPO_MASSA])})
+        _passo(client, resultados, 'delivery_molho', 'post', '/delivery/molho',
+               data={'molho_id': random.choice(ids_delivery[TIPO_MOLHO])})
+        _passo(client, resultados, 'delivery_bebida', 'post', '/delivery/bebida',
+               data={'bebida_id': random.choice(ids_delivery[TIPO_BEBIDA])})
+        _passo(client, resultados, 'delivery_confirmar', 'post', '/delivery/confirmar')
+        carrinho = _passo(client, resultados, 'carrinho', 'get', '/carrinho')
+        # como o navegador: posta o token que veio no formulário do carrinho
+        token = _CHECKOUT_TOKEN.search(carrinho.get_data(as_text=True))
+        _passo(client, resultados, 'finalizar_pedido', 'post', '/finalizar-pedido',
+               data={'checkout_token': token.group(1) if token else ''},
+               esperado=lambda resp: resp.status_code == 302
+               and resp.headers.get('Location', '').endswith('/perfil/pedidos'))
+        _passo(client, resultados, 'perfil_pedidos', 'get', '/perfil/pedidos')
+
+
+def fluxo_admin(app, resultados, fim):
+    client = app.test_client()
+    _passo(client, resultados, 'admin_login', 'post', '/admin_login', json={'senha': os.getenv('ADMIN_PASSWORD')})
+    while time.monotonic() < fim:
+        _passo(client, resultados, 'admin_pedidos', 'get', '/admin/pedidos')
+        _passo(client, resultados, 'admin_pedidos_filtrado', 'get', '/admin/pedidos?status=Em+andamento')
+        time.sleep(0.5)  # um painel de cozinha não atualiza em loop apertado
+
+
+def _commit_atual():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def executar(usuarios, admins, duracao):
+    from app import app
+
+    with Cursor(readonly=True) as cursor:
+        cursor.execute('SELECT produto_id FROM produtos')
+        ids_produtos = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT deliv_tipo, deliv_id FROM produtos_delivery WHERE deliv_tipo IN (1, 4, 5)')
+        ids_delivery = {TIPO_MASSA: [], TIPO_BEBIDA: [], TIPO_MOLHO: []}
+        for tipo, deliv_id in cursor.fetchall():
+            ids_delivery[tipo].append(deliv_id)
+
+    resultados = Resultados()
+    queries_antes = _queries_por_endpoint()
+    inicio = time.monotonic()
+    fim = inicio + duracao
+    with ThreadPoolExecutor(max_workers=usuarios + admins) as executor:
+        tarefas = [executor.submit(fluxo_cliente, app, resultados, 1 + i, ids_produtos, ids_delivery, fim)
+                   for i in range(usuarios)]
+        tarefas += [executor.submit(fluxo_admin, app, resultados, fim) for _ in range(admins)]
+        for tarefa in tarefas:
+            tarefa.result()
+    decorrido = time.monotonic() - inicio
+    queries_depois = _queries_por_endpoint()
+
+    endpoints_por_passo = {'login': 'login', 'cardapio': 'cardapio', 'adicionar_carrinho': 'adicionar_carrinho',
+                           'delivery_massa': 'escolher_massa', 'delivery_molho': 'escolher_molho',
+                           'delivery_bebida': 'escolher_bebida', 'delivery_confirmar': 'confirmar_delivery',
+                           'carrinho': 'carrinho', 'finalizar_pedido': 'finalizar_pedido',
+                           'perfil_pedidos': 'perfil_pedidos', 'admin_login': 'admin_login',
+                           'admin_pedidos': 'admin_pedidos'}
+    passos = {}
+    for passo, valores in sorted(resultados.amostras.items()):
+        endpoint = endpoints_por_passo.get(passo)
+        soma, total = queries_depois.get(endpoint, (0, 0))
+        soma0, total0 = queries_antes.get(endpoint, (0, 0))
+        passos[passo] = {
+            'requests': len(valores),
+            'erros': resultados.erros.get(passo, 0),
+            'p50_ms': _percentil(valores, 50) * 1000,
+            'p95_ms': _percentil(valores, 95) * 1000,
+            'p99_ms': _percentil(valores, 99) * 1000,
+            'rps': len(valores) / decorrido,
+            'queries_por_request': (soma - soma0) / (total - total0) if total > total0 else None,
+        }
+
+    todas = [v for valores in resultados.amostras.values() for v in valores]
+    return {
+        'commit': _commit_atual(),
+        'python': platform.python_version(),
+        'usuarios': usuarios,
+        'admins': admins,
+        'duracao_s': decorrido,
+        'total': {
+            'requests': len(todas),
+            'erros': sum(resultados.erros.values()),
+            'rps': len(todas) / decorrido,
+            'p50_ms': (_percentil(todas, 50) or 0) * 1000,
+            'p95_ms': (_percentil(todas, 95) or 0) * 1000,
+            'p99_ms': (_percentil(todas, 99) or 0) * 1000,
+        },
+        'passos': passos,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark dos fluxos de cliente e admin')
+    parser.add_argument('--seed', action='store_true', help='aplica migrations e popula dados sintéticos')
+    parser.add_argument('--force', action='store_true', help='permite semear num banco sem "bench" no nome')
+    parser.add_argument('--produtos', type=int, default=200)
+    parser.add_argument('--clientes', type=int, default=500)
+    parser.add_argument('--pedidos', type=int, default=50000)
+    parser.add_argument('--usuarios', type=int, default=8, help='clientes simultâneos')
+    parser.add_argument('--admins', type=int, default=1, help='painéis de admin simultâneos')
+    parser.add_argument('--duracao', type=float, default=30, help='segundos de carga')
+    parser.add_argument('--saida', help='grava o relatório JSON neste arquivo')
+    args = parser.parse_args(argv)
+
+    if args.seed:
+        if 'bench' not in (DBNAME or '') and not args.force:
+            parser.error(f'recusando semear o banco {DBNAME!r}; use um banco *bench* ou --force')
+        import migrate
+        migrate.upgrade(saida=lambda msg: print(msg, file=sys.stderr))
+        semear(args.produtos, args.clientes, args.pedidos)
+
+    relatorio = executar(min(args.usuarios, args.clientes), args.admins, args.duracao)
+    texto = json.dumps(relatorio, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            f.write(texto)
+    print(texto)
+    return 1 if relatorio['total']['erros'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
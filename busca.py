@@ -0,0 +1,240 @@
+from catalog_cache import catalog_cache
+from db_config import Cursor
+from dotenv import load_dotenv
+import unicodedata
+import threading
+import catalogo
+import bisect
+import re
+import os
+
+load_dotenv()
+
+# Busca no cardápio: índice invertido em memória (nome + descrição, sem acento) e facetas como
+# bitsets (int do Python, um bit por produto). Uma busca é um punhado de AND/OR entre inteiros.
+#
+# O índice acompanha catalog_cache.version: as rotas de admin aplicam a alteração de um produto
+# direto no índice (atualizar/remover); qualquer outra mudança (importação, outro worker) faz a
+# próxima busca reconstruir tudo a partir do cache do cardápio.
+#
+# BUSCA_BACKEND=postgres (catálogos grandes) não mantém índice nenhum em memória: o texto vai para o
+# tsvector + GIN da migration 007 e as facetas são calculadas por busca, só sobre as linhas que o
+# banco devolveu (um IndiceCardapio descartável, sem os termos).
+
+BUSCA_BACKEND = os.getenv("BUSCA_BACKEND", "memory")  # memory | postgres
+BUSCA_LIMITE = 20
+BUSCA_LIMITE_MAX = 100
+
+FAIXAS_PRECO = (('0-20', 0, 20), ('20-40', 20, 40), ('40-60', 40, 60), ('60+', 60, None))
+NOTAS = (1, 2, 3, 4, 5)  # faceta "avaliação >= n"
+
+_STOPWORDS = {'a', 'o', 'as', 'os', 'e', 'de', 'da', 'do', 'das', 'dos', 'com', 'em', 'no', 'na', 'ao'}
+_PALAVRA = re.compile(r'\w+')
+
+_contar = getattr(int, 'bit_count', None) or (lambda bits: bin(bits).count('1'))
+
+
+def normalizar(texto):
+    # minúsculas e sem acento: "Molho à Bolonhesa" -> "molho a bolonhesa"
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def tokens(texto):
+    return [t for t in _PALAVRA.findall(normalizar(texto)) if t not in _STOPWORDS]
+
+
+def _bits(bitset):
+    while bitset:
+        menor = bitset & -bitset
+        yield menor.bit_length() - 1
+        bitset ^= menor
+
+
+def _faixa_preco(preco):
+    for nome, minimo, maximo in FAIXAS_PRECO:
+        if preco >= minimo and (maximo is None or preco < maximo):
+            return nome
+    return None
+
+
+class IndiceCardapio:
+    def __init__(self, com_texto=True):
+        self.com_texto = com_texto
+        self._lock = threading.Lock()
+        self._versao = None
+        self._limpar()
+
+    def _limpar(self):
+        self._produtos = []  # posição -> Produto (None depois de removido)
+        self._posicao = {}  # produto_id -> posição
+        self._termos = {}  # termo -> bitset
+        self._vocabulario = []  # termos ordenados, para busca por prefixo
+        self._tipo = {}  # tipo -> bitset
+        self._preco = {}  # faixa -> bitset
+        self._nota = {}  # n -> bitset dos produtos com avaliação >= n
+        self._todos = 0
+
+    # construção
+
+    def _adicionar(self, produto):
+        posicao = len(self._produtos)
+        self._produtos.append(produto)
+        self._posicao[produto.id] = posicao
+        bit = 1 << posicao
+        self._todos |= bit
+        if self.com_texto:
+            for termo in set(tokens(produto.nome) + tokens(produto.descricao)):
+                if termo not in self._termos:
+                    self._termos[termo] = 0
+                    bisect.insort(self._vocabulario, termo)
+                self._termos[termo] |= bit
+        if produto.tipo is not None:
+            # produto sem tipo não entra na faceta: uma chave None misturada com os ids quebra o
+            # jsonify (ordena as chaves) e não tem como ser filtrada por ?tipo=
+            self._tipo[produto.tipo] = self._tipo.get(produto.tipo, 0) | bit
+        faixa = _faixa_preco(float(produto.preco or 0))
+        self._preco[faixa] = self._preco.get(faixa, 0) | bit
+        for n in NOTAS:
+            if float(produto.avaliacao or 0) >= n:
+                self._nota[n] = self._nota.get(n, 0) | bit
+
+    def _retirar(self, produto_id):
+        posicao = self._posicao.pop(produto_id, None)
+        if posicao is None:
+            return
+        mascara = ~(1 << posicao)
+        self._produtos[posicao] = None
+        self._todos &= mascara
+        for conjunto in (self._termos, self._tipo, self._preco, self._nota):
+            for chave in conjunto:
+                conjunto[chave] &= mascara
+        # a posição fica vaga até a próxima reconstrução; termos vazios continuam no vocabulário
+
+    @classmethod
+    def de_produtos(cls, produtos):
+        # só facetas, sobre um conjunto já filtrado pelo texto
+        indice = cls(com_texto=False)
+        for produto in produtos:
+            indice._adicionar(produto)
+        return indice
+
+    def reconstruir(self):
+        versao = catalog_cache.version
+        produtos = catalog_cache.get_or_load('cardapio', catalogo.listar_produtos)
+        with self._lock:
+            self._limpar()
+            for produto in produtos:
+                self._adicionar(produto)
+            self._versao = versao
+
+    def _garantir_atual(self):
+        if self._versao != catalog_cache.version:
+            self.reconstruir()
+
+    def atualizar(self, produto_id):
+        # Chamar depois do catalog_cache.invalidate() da rota de admin: se essa foi a única
+        # mudança desde a última construção, aplica só este produto; senão reconstrói na próxima busca
+        if self._versao is None:
+            return  # nunca construído (ou BUSCA_BACKEND=postgres): nem consulta o produto
+        produto = catalogo.buscar_produto(produto_id)
+        with self._lock:
+            if self._versao is None or catalog_cache.version != self._versao + 1:
+                return
+            self._retirar(produto_id)
+            if produto is not None:
+                self._adicionar(produto)
+            self._versao = catalog_cache.version
+
+    def remover(self, produto_id):
+        with self._lock:
+            if self._versao is None or catalog_cache.version != self._versao + 1:
+                return
+            self._retirar(produto_id)
+            self._versao = catalog_cache.version
+
+    # consulta
+
+    def _termo(self, termo):
+        # OR de todos os termos do vocabulário que começam com `termo` (busca enquanto digita)
+        bits = 0
+        i = bisect.bisect_left(self._vocabulario, termo)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(termo):
+            bits |= self._termos[self._vocabulario[i]]
+            i += 1
+        return bits
+
+    def _texto(self, consulta):
+        bits = self._todos
+        for termo in tokens(consulta):
+            bits &= self._termo(termo)
+            if not bits:
+                break
+        return bits
+
+    def buscar(self, consulta='', tipos=(), faixas=(), nota_min=None, limite=BUSCA_LIMITE):
+        self._garantir_atual()
+        with self._lock:
+            return self._filtrar(self._texto(consulta), tipos, faixas, nota_min, limite)
+
+    def _filtrar(self, texto, tipos, faixas, nota_min, limite):
+        filtros = {
+            'tipo': self._uniao(self._tipo, tipos),
+            'preco': self._uniao(self._preco, faixas),
+            'avaliacao': self._nota.get(nota_min, 0) if nota_min else None,
+        }
+
+        def aplicar(exceto=None):
+            bits = texto
+            for nome, filtro in filtros.items():
+                if nome != exceto and filtro is not None:
+                    bits &= filtro
+            return bits
+
+        resultado = aplicar()
+        # cada faceta conta com os outros filtros aplicados, mas não com o dela mesma
+        facetas = {
+            'tipo': self._contagens(self._tipo, aplicar('tipo')),
+            'preco': self._contagens(self._preco, aplicar('preco')),
+            'avaliacao': self._contagens(self._nota, aplicar('avaliacao')),
+        }
+        encontrados = [self._produtos[i] for i in _bits(resultado)]
+        encontrados.sort(key=lambda p: (-float(p.avaliacao or 0), p.nome))
+        return {
+            'total': len(encontrados),
+            'itens': [p.as_dict() for p in encontrados[:limite]],
+            'facetas': facetas,
+        }
+
+    @staticmethod
+    def _uniao(conjunto, chaves):
+        if not chaves:
+            return None
+        bits = 0
+        for chave in chaves:
+            bits |= conjunto.get(chave, 0)
+        return bits
+
+    @staticmethod
+    def _contagens(conjunto, bits):
+        return {chave: _contar(valor & bits) for chave, valor in conjunto.items() if valor & bits}
+
+
+def _produtos_postgres(cursor, consulta):
+    # Texto resolvido pelo índice GIN (busca_texto, migration 007); prefixo em cada termo
+    termos = tokens(consulta)
+    if not termos:
+        return catalogo.iterar_produtos(cursor)
+    sql = catalogo._SQL_PRODUTOS + " WHERE busca_texto(produto_nome, produto_desc) @@ to_tsquery('simple', %s)"
+    return catalogo._iterar(cursor, 'busca_produtos', sql, (' & '.join(t + ':*' for t in termos),), catalogo.Produto)
+
+
+indice_busca = IndiceCardapio()
+
+
+def buscar(consulta='', tipos=(), faixas=(), nota_min=None, limite=BUSCA_LIMITE):
+    if BUSCA_BACKEND != 'postgres':
+        return indice_busca.buscar(consulta, tipos, faixas, nota_min, limite)
+    with Cursor(readonly=True) as cursor:
+        indice = IndiceCardapio.de_produtos(_produtos_postgres(cursor, consulta))
+    return indice._filtrar(indice._todos, tipos, faixas, nota_min, limite)
@@ -0,0 +1,180 @@
+from collections import OrderedDict
+from db_config import Cursor
+from dotenv import load_dotenv
+import threading
+import sqlite3
+import json
+import time
+import os
+
+load_dotenv()
+
+CART_BACKEND = os.getenv("CART_BACKEND", "memory")  # memory | sqlite | postgres
+CART_SQLITE_PATH = os.getenv("CART_SQLITE_PATH", "carrinhos.sqlite3")
+CART_TTL = float(os.getenv("CART_TTL", str(7 * 24 * 3600)))  # carrinhos abandonados somem depois disso
+
+
+# Cada linha do carrinho é identificada por uma chave estável:
+#   'p:<produto_id>' para produtos do cardápio
+#   'd:<massa>-<molho>-<bebida>' para pratos montados no delivery
+def chave_produto(produto_id):
+    return 'p:%s' % produto_id
+
+
+def chave_delivery(massa_id, molho_id, bebida_id):
+    return 'd:%s-%s-%s' % (massa_id, molho_id, bebida_id)
+
+
+class MemoryCartStore:
+    def __init__(self, ttl=CART_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._carts = {}  # cart_id -> (ultimo_acesso, OrderedDict chave -> linha)
+        self._next_purge = time.monotonic() + 60
+
+    def _cart(self, cart_id, now):
+        entry = self._carts.get(cart_id)
+        lines = entry[1] if entry else OrderedDict()
+        self._carts[cart_id] = (now, lines)
+        return lines
+
+    def _purge(self, now):
+        if now < self._next_purge:
+            return
+        self._next_purge = now + 60
+        expirados = [cid for cid, (acesso, _) in self._carts.items() if now - acesso > self.ttl]
+        for cid in expirados:
+            del self._carts[cid]
+
+    def get(self, cart_id):
+        with self._lock:
+            entry = self._carts.get(cart_id)
+            return [dict(linha) for linha in entry[1].values()] if entry else []
+
+    def add(self, cart_id, chave, item, quantidade=1):
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            lines = self._cart(cart_id, now)
+            linha = lines.get(chave)
+            if linha:
+                linha['quantidade'] += quantidade
+            else:
+                lines[chave] = dict(item, chave=chave, quantidade=quantidade)
+
+    def remove(self, cart_id, chave):
+        with self._lock:
+            entry = self._carts.get(cart_id)
+            if entry:
+                entry[1].pop(chave, None)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+
+class SQLiteCartStore:
+    def __init__(self, path=CART_SQLITE_PATH, ttl=CART_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS carrinho_itens (
+                    cart_id TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    item TEXT NOT NULL,
+                    quantidade INTEGER NOT NULL,
+                    atualizado REAL NOT NULL,
+                    PRIMARY KEY (cart_id, chave)
+                )
+            ''')
+            conn.execute('DELETE FROM carrinho_itens WHERE atualizado < ?', (time.time() - self.ttl,))
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def get(self, cart_id):
+        rows = self._conn().execute(
+            'SELECT chave, item, quantidade FROM carrinho_itens WHERE cart_id = ? ORDER BY rowid',
+            (cart_id,)).fetchall()
+        return [dict(json.loads(item), chave=chave, quantidade=qtde) for chave, item, qtde in rows]
+
+    def add(self, cart_id, chave, item, quantidade=1):
+        with self._conn() as conn:
+            conn.execute('''
+                INSERT INTO carrinho_itens (cart_id, chave, item, quantidade, atualizado)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (cart_id, chave)
+                DO UPDATE SET quantidade = quantidade + excluded.quantidade, atualizado = excluded.atualizado
+            ''', (cart_id, chave, json.dumps(item), quantidade, time.time()))
+
+    def remove(self, cart_id, chave):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM carrinho_itens WHERE cart_id = ? AND chave = ?', (cart_id, chave))
+
+    def clear(self, cart_id):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM carrinho_itens WHERE cart_id = ?', (cart_id,))
+
+
+class PostgresCartStore:
+    # Tabela da migration 008. Nada de banco no construtor: o store é criado no import do app,
+    # e o worker tem que subir mesmo com o banco fora do ar
+    def __init__(self, ttl=CART_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+    def _purge(self, cursor):
+        # carrinhos abandonados saem aos poucos, no máximo uma vez por minuto por processo
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + 60
+        cursor.execute("DELETE FROM carrinho_itens WHERE atualizado < now() - make_interval(secs => %s)",
+                       (self.ttl,))
+
+    def get(self, cart_id):
+        with Cursor(readonly=True, replica=False) as cursor:
+            cursor.execute('''
+                SELECT chave, item, quantidade FROM carrinho_itens
+                WHERE cart_id = %s ORDER BY linha_id
+            ''', (cart_id,))
+            return [dict(item, chave=chave, quantidade=qtde) for chave, item, qtde in cursor.fetchall()]
+
+    def add(self, cart_id, chave, item, quantidade=1):
+        with Cursor() as cursor:
+            self._purge(cursor)
+            cursor.execute('''
+                INSERT INTO carrinho_itens (cart_id, chave, item, quantidade)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (cart_id, chave)
+                DO UPDATE SET quantidade = carrinho_itens.quantidade + EXCLUDED.quantidade, atualizado = now()
+            ''', (cart_id, chave, json.dumps(item), quantidade))
+
+    def remove(self, cart_id, chave):
+        with Cursor() as cursor:
+            cursor.execute('DELETE FROM carrinho_itens WHERE cart_id = %s AND chave = %s', (cart_id, chave))
+
+    def clear(self, cart_id):
+        with Cursor() as cursor:
+            cursor.execute('DELETE FROM carrinho_itens WHERE cart_id = %s', (cart_id,))
+
+
+def create_cart_store(backend=CART_BACKEND):
+    if backend == 'memory':
+        return MemoryCartStore()
+    if backend == 'sqlite':
+        return SQLiteCartStore()
+    if backend == 'postgres':
+        return PostgresCartStore()
+    raise ValueError("CART_BACKEND inválido: %r" % backend)
+
+
+cart_store = create_cart_store()
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from db_config import Cursor
+from shared_cache import shared_cache
+from dotenv import load_dotenv
+import threading
+import time
+import os
+
+load_dotenv()
+
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", "300"))
+CATALOG_CACHE_MAX = int(os.getenv("CATALOG_CACHE_MAX", "64"))
+# Intervalo (s) para consultar a versão compartilhada entre workers; 0 desliga
+CATALOG_VERSION_POLL = float(os.getenv("CATALOG_VERSION_POLL", "0"))
+
+
+class CatalogCache:
+    """Cache em memória do cardápio, invalidado pelas rotas de admin."""
+
+    def __init__(self, ttl=CATALOG_CACHE_TTL, max_entries=CATALOG_CACHE_MAX, version_poll=CATALOG_VERSION_POLL,
+                 shared=None, namespace=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_poll = version_poll
+        # com um cache compartilhado, um miss aqui ainda pode ser hit em outro nó, e só um nó
+        # recarrega uma chave que expirou; a versão do namespace substitui o poll no banco
+        self.shared = shared
+        self.namespace = namespace
+        self._shared_ns_version = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # chave -> (versao, expira_em, valor)
+        self._version = 0
+        self._shared_version = None
+        self._next_poll = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def version(self):
+        self._sync_shared_version()
+        return self._version
+
+    def get(self, key, default=None):
+        # só consulta; não carrega nem conta hit/miss (o modo ASGI carrega de forma assíncrona)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == self._version and entry[1] > time.monotonic():
+                return entry[2]
+        return default
+
+    def get_or_load(self, key, loader):
+        self._sync_shared_version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == self._version and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            version = self._version
+
+        if self.shared is not None:
+            value = self.shared.get_or_load(self.namespace, repr(key), loader, self.ttl)
+        else:
+            value = loader()
+
+        with self._lock:
+            if version == self._version:  # não guarda se alguém invalidou durante a carga
+                self._entries[key] = (version, now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.invalidate(self.namespace)
+            self._shared_ns_version = self.shared.versao(self.namespace)
+        if self.version_poll:
+            # catalogo_versao vem da migration 001
+            with Cursor() as cursor:
+                cursor.execute('UPDATE catalogo_versao SET versao = versao + 1 WHERE id = 1 RETURNING versao')
+                self._shared_version = cursor.fetchone()[0]
+
+    def _sync_shared_version(self):
+        if self.shared is not None:
+            versao = self.shared.versao(self.namespace)  # lida do store no máximo a cada local_ttl
+            if self._shared_ns_version is not None and versao != self._shared_ns_version:
+                with self._lock:
+                    self._version += 1
+                    self._entries.clear()
+            self._shared_ns_version = versao
+        # Outro worker pode ter alterado o cardápio: uma leitura barata a cada version_poll segundos
+        if not self.version_poll:
+            return
+        now = time.monotonic()
+        if now < self._next_poll:
+            return
+        self._next_poll = now + self.version_poll
+        with Cursor(readonly=True, replica=False) as cursor:
+            cursor.execute('SELECT versao FROM catalogo_versao WHERE id = 1')
+            row = cursor.fetchone()
+        shared = row[0] if row else 0
+        if self._shared_version is not None and shared != self._shared_version:
+            with self._lock:
+                self._version += 1
+                self._entries.clear()
+        self._shared_version = shared
+
+
+catalog_cache = CatalogCache(shared=shared_cache if shared_cache.distribuido else None, namespace='catalogo')
@@ -0,0 +1,123 @@
+from db_config import Cursor
+import itertools
+
+# Acesso ao catálogo num lugar só: as rotas recebem registros prontos em vez de montar dicts
+# a partir de tuplas posicionais. A ordem das colunas de cada SELECT segue a ordem dos __slots__.
+
+TIPO_MASSA = 1
+TIPO_BEBIDA = 4
+TIPO_MOLHO = 5
+
+ITERSIZE = 500  # linhas por ida ao banco nos cursores nomeados
+
+
+class _Registro:
+    __slots__ = ()
+
+    def __init__(self, *valores):
+        for campo, valor in zip(self.__slots__, valores):
+            setattr(self, campo, valor)
+
+    def as_dict(self):
+        return {campo: getattr(self, campo) for campo in self.__slots__}
+
+    def __getstate__(self):
+        return tuple(getattr(self, campo) for campo in self.__slots__)
+
+    def __setstate__(self, estado):
+        self.__init__(*estado)
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, ', '.join(f'{c}={getattr(self, c)!r}' for c in self.__slots__))
+
+
+class Produto(_Registro):
+    __slots__ = ('id', 'nome', 'preco', 'descricao', 'tipo', 'avaliacao')
+
+
+class ItemDelivery(_Registro):
+    __slots__ = ('id', 'nome', 'preco', 'descricao', 'tipo', 'avaliacao')
+
+
+class Tipo(_Registro):
+    __slots__ = ('id', 'nome')
+
+
+_SQL_PRODUTOS = '''
+    SELECT produto_id, produto_nome, produto_preco, produto_desc, produto_tipo, produto_avaliacao
+    FROM produtos
+'''
+
+_SQL_DELIVERY = '''
+    SELECT deliv_id, deliv_nome, deliv_preco, deliv_desc, deliv_tipo, deliv_avaliacao
+    FROM produtos_delivery
+'''
+
+
+def _iterar(cursor, nome, sql, params, classe):
+    # cursor nomeado (server-side): a listagem não é carregada inteira na memória do cliente
+    with cursor.connection.cursor(name=nome) as server_cursor:
+        server_cursor.itersize = ITERSIZE
+        server_cursor.execute(sql, params)
+        for row in server_cursor:
+            yield classe(*row)
+
+
+def iterar_produtos(cursor):
+    return _iterar(cursor, 'iter_produtos', _SQL_PRODUTOS + ' ORDER BY produto_id', None, Produto)
+
+
+def iterar_delivery(cursor):
+    return _iterar(cursor, 'iter_delivery', _SQL_DELIVERY + ' ORDER BY deliv_id', None, ItemDelivery)
+
+
+# As leituras daqui enchem o catalog_cache (e o cache compartilhado): vêm do primário, senão uma
+# réplica atrasada devolve o cardápio de antes da alteração e ele fica em cache até a próxima invalidação.
+
+def listar_produtos():
+    with Cursor(readonly=True, replica=False) as cursor:
+        cursor.execute(_SQL_PRODUTOS + ' ORDER BY produto_id')
+        return [Produto(*row) for row in cursor.fetchall()]
+
+
+def buscar_produto(produto_id):
+    with Cursor(readonly=True, replica=False) as cursor:
+        cursor.execute(_SQL_PRODUTOS + ' WHERE produto_id = %s', (produto_id,))
+        row = cursor.fetchone()
+    return Produto(*row) if row else None
+
+
+def listar_delivery():
+    with Cursor(readonly=True, replica=False) as cursor:
+        cursor.execute(_SQL_DELIVERY + ' ORDER BY deliv_tipo, deliv_id')
+        return [ItemDelivery(*row) for row in cursor.fetchall()]
+
+
+def delivery_por_tipo():
+    # Uma query para as três etapas do delivery: {deliv_tipo: [ItemDelivery, ...]}
+    return {tipo: list(itens) for tipo, itens in itertools.groupby(listar_delivery(), key=lambda i: i.tipo)}
+
+
+def buscar_item_delivery(deliv_id):
+    with Cursor(readonly=True, replica=False) as cursor:
+        cursor.execute(_SQL_DELIVERY + ' WHERE deliv_id = %s', (deliv_id,))
+        row = cursor.fetchone()
+    return ItemDelivery(*row) if row else None
+
+
+async def listar_produtos_async(cursor):
+    # versões para o modo ASGI: recebem um cursor do db_async
+    await cursor.execute(_SQL_PRODUTOS + ' ORDER BY produto_id')
+    return [Produto(*row) for row in await cursor.fetchall()]
+
+
+async def delivery_por_tipo_async(cursor):
+    await cursor.execute(_SQL_DELIVERY + ' ORDER BY deliv_tipo, deliv_id')
+    itens = [ItemDelivery(*row) for row in await cursor.fetchall()]
+    return {tipo: list(grupo) for tipo, grupo in itertools.groupby(itens, key=lambda i: i.tipo)}
+
+
+def listar_tipos():
+    with Cursor(readonly=True, replica=False) as cursor:
+        cursor.execute('SELECT tipo_id, tipo_nome FROM tipos ORDER BY tipo_id')
+        return [Tipo(*row) for row in cursor.fetchall()]
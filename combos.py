@@ -0,0 +1,76 @@
+from catalog_cache import catalog_cache
+import catalogo
+
+# Preço e nome de um prato do delivery (massa + molho + bebida) calculados a partir do
+# catálogo em cache, sem ir ao banco. O índice por id é refeito junto com o cache do cardápio.
+
+ETAPAS = (
+    ('massa_id', catalogo.TIPO_MASSA),
+    ('molho_id', catalogo.TIPO_MOLHO),
+    ('bebida_id', catalogo.TIPO_BEBIDA),
+)
+
+
+class ComboInvalido(ValueError):
+    pass
+
+
+class Combo:
+    __slots__ = ('massa', 'molho', 'bebida', 'nome', 'preco')
+
+    def __init__(self, massa, molho, bebida):
+        self.massa = massa
+        self.molho = molho
+        self.bebida = bebida
+        self.nome = f"Prato Delivery ({massa.nome}, {molho.nome}, {bebida.nome})"
+        self.preco = massa.preco + molho.preco + bebida.preco
+
+    @property
+    def itens(self):
+        return (self.massa, self.molho, self.bebida)
+
+    def item_carrinho(self):
+        return {
+            'tipo': 'delivery',
+            'massa_id': self.massa.id,
+            'molho_id': self.molho.id,
+            'bebida_id': self.bebida.id,
+            'nome': self.nome,
+            'preco': float(self.preco)
+        }
+
+    def as_dict(self):
+        return {
+            'massa_id': self.massa.id,
+            'molho_id': self.molho.id,
+            'bebida_id': self.bebida.id,
+            'nome': self.nome,
+            'preco': float(self.preco)
+        }
+
+
+def opcoes_delivery():
+    # {deliv_tipo: [ItemDelivery, ...]} — uma query para todas as etapas
+    return catalog_cache.get_or_load('delivery', catalogo.delivery_por_tipo)
+
+
+def _indexar():
+    return {item.id: item for itens in opcoes_delivery().values() for item in itens}
+
+
+def indice_delivery():
+    return catalog_cache.get_or_load('delivery_indice', _indexar)
+
+
+def cotar_combo(massa_id, molho_id, bebida_id):
+    indice = indice_delivery()
+    escolhidos = []
+    for (campo, tipo), valor in zip(ETAPAS, (massa_id, molho_id, bebida_id)):
+        try:
+            item = indice.get(int(valor))
+        except (TypeError, ValueError):
+            item = None
+        if item is None or item.tipo != tipo:
+            raise ComboInvalido(campo)
+        escolhidos.append(item)
+    return Combo(*escolhidos)
@@ -0,0 +1,64 @@
+from db_config import USER, PASSWORD, HOST, PORT, DBNAME
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Pool assíncrono (psycopg 3) usado só pelo modo ASGI (asgi.py). As queries são as mesmas do
+# psycopg2: os dois drivers usam %s como placeholder.
+
+ASYNC_POOL_MIN = int(os.getenv("DB_ASYNC_POOL_MIN", "1"))
+ASYNC_POOL_MAX = int(os.getenv("DB_ASYNC_POOL_MAX", "20"))
+ASYNC_POOL_TIMEOUT = float(os.getenv("DB_ASYNC_POOL_TIMEOUT", "10"))
+
+CONNINFO = ' '.join(f'{chave}={valor}' for chave, valor in (
+    ('user', USER), ('password', PASSWORD), ('host', HOST), ('port', PORT), ('dbname', DBNAME)
+) if valor is not None)
+
+db_pool_async = None
+
+
+async def abrir():
+    # Chamado no startup do ASGI (lifespan), já dentro do worker e do event loop dele
+    global db_pool_async
+    from psycopg_pool import AsyncConnectionPool
+
+    if db_pool_async is None:
+        db_pool_async = AsyncConnectionPool(CONNINFO, min_size=ASYNC_POOL_MIN, max_size=ASYNC_POOL_MAX,
+                                            timeout=ASYNC_POOL_TIMEOUT, open=False)
+        await db_pool_async.open()
+
+
+async def fechar():
+    global db_pool_async
+    if db_pool_async is not None:
+        await db_pool_async.close()
+        db_pool_async = None
+
+
+class Cursor:
+    # Mesmo contrato do db_config.Cursor: commit no fim, rollback em exceção, readonly nunca grava.
+    # O pool assíncrono só conecta no primário; replica existe para as chamadas ficarem iguais.
+    def __init__(self, commit=True, readonly=False, replica=True):
+        self._do_commit = commit
+        self._readonly = readonly
+
+    async def __aenter__(self):
+        if db_pool_async is None:
+            await abrir()
+        self._contexto = db_pool_async.connection()
+        self.conn = await self._contexto.__aenter__()
+        self.cursor = self.conn.cursor()
+        if self._readonly:
+            await self.cursor.execute('SET TRANSACTION READ ONLY')
+        return self.cursor
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self.cursor.close()
+            if exc_type is None and not (self._do_commit and not self._readonly):
+                await self.conn.rollback()
+        finally:
+            # o pool faz commit se não houve exceção, rollback se houve
+            await self._contexto.__aexit__(exc_type, exc_val, exc_tb)
+        return False
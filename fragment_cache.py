@@ -0,0 +1,66 @@
+from flask import render_template, request, session, make_response, current_app
+from catalog_cache import catalog_cache
+from markupsafe import Markup
+import hashlib
+import catalogo
+import os
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+
+def _versao_templates():
+    # Mesmo valor em todos os workers enquanto os templates não mudarem
+    h = hashlib.sha1()
+    for raiz, _, arquivos in sorted(os.walk(TEMPLATES_DIR)):
+        for nome in sorted(arquivos):
+            with open(os.path.join(raiz, nome), 'rb') as f:
+                h.update(nome.encode())
+                h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+TEMPLATES_VERSION = os.getenv("TEMPLATES_VERSION") or _versao_templates()
+
+
+def precompilar_templates(app):
+    # Compila todos os templates na subida em vez de no primeiro request de cada página
+    for nome in app.jinja_env.list_templates():
+        if nome.endswith('.html'):
+            app.jinja_env.get_template(nome)
+
+
+def fragmento(template, chave, loader, **contexto):
+    # HTML pronto do trecho que só depende do cardápio; invalidado junto com o catalog_cache
+    def render():
+        return Markup(render_template(template, **loader(), **contexto))
+    return catalog_cache.get_or_load(('fragmento', template, chave), render)
+
+
+def _impressao_catalogo():
+    # Hash do conteúdo do cardápio, não do contador do catalog_cache (que é de cada processo e
+    # volta a zero no restart): o mesmo ETag em todos os workers e nós enquanto o cardápio não mudar
+    h = hashlib.sha1()
+    for produto in catalog_cache.get_or_load('cardapio', catalogo.listar_produtos):
+        h.update(repr(produto).encode())
+    for itens in catalog_cache.get_or_load('delivery', catalogo.delivery_por_tipo).values():
+        for item in itens:
+            h.update(repr(item).encode())
+    return h.hexdigest()[:12]
+
+
+def etag_catalogo(*partes):
+    versao = catalog_cache.get_or_load('etag', _impressao_catalogo)
+    assets = current_app.config.get('ASSETS_VERSION', '')
+    bruto = '|'.join(str(p) for p in (TEMPLATES_VERSION, assets, versao) + partes)
+    return hashlib.sha1(bruto.encode()).hexdigest()
+
+
+def pagina_com_etag(etag, render):
+    # 304 sem renderizar nada quando o navegador já tem esta versão; mensagens flash sempre renderizam
+    if '_flashes' not in session and request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+    else:
+        resp = make_response(render())
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
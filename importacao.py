@@ -0,0 +1,255 @@
+from decimal import Decimal, InvalidOperation
+from db_config import Cursor
+import json
+import csv
+import io
+
+# Importação/exportação em massa do catálogo.
+# Importar: valida linha a linha enquanto lê o arquivo, manda as válidas por COPY para uma
+# tabela temporária e faz o upsert de uma vez. Exportar: cursor nomeado, linha a linha.
+
+MAX_ERROS_RELATORIO = 100
+
+
+class ArquivoInvalido(ValueError):
+    """O arquivo inteiro foi recusado (não dá para seguir lendo), não só uma linha."""
+
+
+class Tabela:
+    def __init__(self, nome, chave, colunas):
+        self.nome = nome
+        self.chave = chave
+        self.colunas = colunas  # [(campo_no_arquivo, coluna_no_banco, validador)]
+
+    @property
+    def campos(self):
+        return [campo for campo, _, _ in self.colunas]
+
+    @property
+    def colunas_db(self):
+        return [coluna for _, coluna, _ in self.colunas]
+
+
+def _texto(obrigatorio):
+    def validar(valor):
+        valor = (valor or '').strip() if isinstance(valor, str) or valor is None else str(valor)
+        if obrigatorio and not valor:
+            raise ValueError('obrigatório')
+        return valor or None
+    return validar
+
+
+def _inteiro(obrigatorio=False):
+    def validar(valor):
+        if valor in (None, ''):
+            if obrigatorio:
+                raise ValueError('obrigatório')
+            return None
+        # int() truncaria 1.5 do JSON sem avisar
+        if isinstance(valor, bool) or (isinstance(valor, float) and not valor.is_integer()):
+            raise ValueError(f'{valor!r} não é inteiro')
+        return int(valor)
+    return validar
+
+
+def _decimal(minimo=None, maximo=None, obrigatorio=True):
+    def validar(valor):
+        if valor in (None, ''):
+            if obrigatorio:
+                raise ValueError('obrigatório')
+            return None
+        try:
+            numero = Decimal(str(valor).replace(',', '.'))
+        except InvalidOperation:
+            raise ValueError('número inválido')
+        if (minimo is not None and numero < minimo) or (maximo is not None and numero > maximo):
+            raise ValueError(f'fora do intervalo {minimo}..{maximo}')
+        return numero
+    return validar
+
+
+TABELAS = {
+    'produtos': Tabela('produtos', 'produto_id', [
+        ('id', 'produto_id', _inteiro()),
+        ('nome', 'produto_nome', _texto(True)),
+        ('preco', 'produto_preco', _decimal(0)),
+        ('descricao', 'produto_desc', _texto(False)),
+        ('tipo', 'produto_tipo', _inteiro()),
+        ('avaliacao', 'produto_avaliacao', _decimal(0, 5, obrigatorio=False)),
+    ]),
+    'produtos_delivery': Tabela('produtos_delivery', 'deliv_id', [
+        ('id', 'deliv_id', _inteiro()),
+        ('nome', 'deliv_nome', _texto(True)),
+        ('preco', 'deliv_preco', _decimal(0)),
+        ('descricao', 'deliv_desc', _texto(False)),
+        ('tipo', 'deliv_tipo', _inteiro()),
+        ('avaliacao', 'deliv_avaliacao', _decimal(0, 5, obrigatorio=False)),
+    ]),
+    'tipos': Tabela('tipos', 'tipo_id', [
+        ('id', 'tipo_id', _inteiro()),
+        ('nome', 'tipo_nome', _texto(True)),
+    ]),
+}
+
+
+def _linhas(arquivo):
+    try:
+        yield from arquivo
+    except UnicodeDecodeError as e:
+        raise ArquivoInvalido('o arquivo não está em UTF-8') from e
+
+
+def ler_registros(arquivo, formato):
+    # arquivo: texto. csv com cabeçalho, ou json com um objeto por linha (NDJSON)
+    arquivo = _linhas(arquivo)
+    if formato == 'csv':
+        for numero, registro in enumerate(csv.DictReader(arquivo), start=2):
+            yield numero, registro
+    else:
+        for numero, linha in enumerate(arquivo, start=1):
+            if linha.strip():
+                try:
+                    yield numero, json.loads(linha)
+                except json.JSONDecodeError as e:
+                    yield numero, e
+
+
+class _CopyStream(io.RawIOBase):
+    """Arquivo de leitura que gera o CSV do COPY sob demanda, sem montar tudo na memória."""
+
+    def __init__(self, linhas):
+        self._linhas = linhas
+        self._buffer = b''
+        self.erro = None  # exceção do gerador; o COPY termina e quem chamou relança
+
+    def readable(self):
+        return True
+
+    def read(self, tamanho=-1):
+        while tamanho < 0 or len(self._buffer) < tamanho:
+            try:
+                self._buffer += next(self._linhas)
+            except StopIteration:
+                break
+            except Exception as e:
+                self.erro = e
+                break
+        if tamanho < 0:
+            tamanho = len(self._buffer)
+        pedaco, self._buffer = self._buffer[:tamanho], self._buffer[tamanho:]
+        return pedaco
+
+
+def _linhas_validas(tabela, registros, relatorio, tipos_validos):
+    saida = io.StringIO()
+    escritor = csv.writer(saida)
+    posicao_chave = tabela.colunas_db.index(tabela.chave)
+    vistas = {}  # chave -> linha: o mesmo id duas vezes quebraria o ON CONFLICT DO UPDATE do upsert
+    for numero, registro in registros:
+        relatorio['lidas'] += 1
+        try:
+            if isinstance(registro, Exception):
+                raise ValueError(str(registro))
+            if not isinstance(registro, dict):
+                raise ValueError(f'esperado um objeto, veio {type(registro).__name__}')
+            valores = []
+            for campo, _, validar in tabela.colunas:
+                try:
+                    valores.append(validar(registro.get(campo)))
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f'{campo}: {e}')
+            if 'tipo' in tabela.campos:
+                tipo = valores[tabela.campos.index('tipo')]
+                if tipo is not None and tipo not in tipos_validos:
+                    raise ValueError(f'tipo: {tipo} não existe')
+            chave = valores[posicao_chave]
+            if chave is not None:
+                if chave in vistas:
+                    raise ValueError(f'id: {chave} repetido (já aparece na linha {vistas[chave]})')
+                vistas[chave] = numero
+        except ValueError as e:
+            relatorio['invalidas'] += 1
+            if len(relatorio['erros']) < MAX_ERROS_RELATORIO:
+                relatorio['erros'].append({'linha': numero, 'erro': str(e)})
+            continue
+        relatorio['validas'] += 1
+        escritor.writerow(['\\N' if v is None else v for v in valores])
+        yield saida.getvalue().encode('utf-8')
+        saida.seek(0)
+        saida.truncate()
+
+
+def importar(tabela_nome, arquivo, formato='csv', simular=False):
+    tabela = TABELAS[tabela_nome]
+    relatorio = {'tabela': tabela_nome, 'lidas': 0, 'validas': 0, 'invalidas': 0,
+                 'inseridas': 0, 'atualizadas': 0, 'simulacao': simular, 'erros': []}
+    colunas = ', '.join(tabela.colunas_db)
+    sem_chave = ', '.join(c for c in tabela.colunas_db if c != tabela.chave)
+    atualizar = ', '.join(f'{c} = EXCLUDED.{c}' for c in tabela.colunas_db if c != tabela.chave)
+
+    with Cursor(commit=not simular) as cursor:
+        tipos_validos = set()
+        if 'tipo' in tabela.campos:
+            cursor.execute('SELECT tipo_id FROM tipos')
+            tipos_validos = {row[0] for row in cursor.fetchall()}
+
+        cursor.execute(f'''
+            CREATE TEMP TABLE staging_importacao ON COMMIT DROP AS
+            SELECT {colunas} FROM {tabela.nome} WITH NO DATA
+        ''')
+        stream = _CopyStream(_linhas_validas(tabela, ler_registros(arquivo, formato), relatorio, tipos_validos))
+        cursor.copy_expert(f"COPY staging_importacao ({colunas}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                           stream)
+        if stream.erro is not None:
+            raise stream.erro
+
+        # com id: upsert; sem id: produto novo
+        cursor.execute(f'''
+            INSERT INTO {tabela.nome} ({colunas})
+            SELECT {colunas} FROM staging_importacao WHERE {tabela.chave} IS NOT NULL
+            ON CONFLICT ({tabela.chave}) DO UPDATE SET {atualizar}
+            RETURNING (xmax = 0)
+        ''')
+        for (inserida,) in cursor.fetchall():
+            relatorio['inseridas' if inserida else 'atualizadas'] += 1
+        cursor.execute(f'''
+            INSERT INTO {tabela.nome} ({sem_chave})
+            SELECT {sem_chave} FROM staging_importacao WHERE {tabela.chave} IS NULL
+        ''')
+        relatorio['inseridas'] += cursor.rowcount
+
+        # ids explícitos não avançam a sequence; acerta para os próximos INSERTs
+        cursor.execute(f'''
+            SELECT setval(pg_get_serial_sequence(%s, %s), GREATEST((SELECT max({tabela.chave}) FROM {tabela.nome}), 1))
+        ''', (tabela.nome, tabela.chave))
+    return relatorio
+
+
+def exportar(tabela_nome, formato='csv', tamanho_lote=500):
+    # Gerador de pedaços de texto: cada lote lido do banco já sai para o cliente
+    tabela = TABELAS[tabela_nome]
+    colunas = ', '.join(tabela.colunas_db)
+    with Cursor(readonly=True) as cursor:
+        with cursor.connection.cursor(name=f'exportar_{tabela_nome}') as server_cursor:
+            server_cursor.itersize = tamanho_lote
+            server_cursor.execute(f'SELECT {colunas} FROM {tabela.nome} ORDER BY {tabela.chave}')
+
+            saida = io.StringIO()
+            escritor = csv.writer(saida)
+            if formato == 'csv':
+                escritor.writerow(tabela.campos)
+            while True:
+                lote = server_cursor.fetchmany(tamanho_lote)
+                if not lote:
+                    break
+                for row in lote:
+                    if formato == 'csv':
+                        escritor.writerow(row)
+                    else:
+                        saida.write(json.dumps(dict(zip(tabela.campos, row)), default=str, ensure_ascii=False))
+                        saida.write('\n')
+                yield saida.getvalue()
+                saida.seek(0)
+                saida.truncate()
+            if formato == 'csv' and saida.getvalue():
+                yield saida.getvalue()
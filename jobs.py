@@ -0,0 +1,302 @@
+from dotenv import load_dotenv
+from collections import deque
+import metrics
+import threading
+import logging
+import sqlite3
+import heapq
+import json
+import uuid
+import time
+import os
+
+load_dotenv()
+
+# Fila de tarefas pós-checkout. O request só faz commit do pedido e enfileira; as threads
+# daqui executam o resto, com retentativas. A chave de cada job (ex.: 'analytics:42') garante
+# que o mesmo trabalho não é enfileirado duas vezes.
+#
+# O backend memory perde os jobs pendentes quando o processo reinicia (por isso analytics liga
+# o recálculo periódico por padrão nesse caso). O sqlite guarda a fila num arquivo compartilhado
+# pelos workers da máquina: cada job em execução tem um lease renovado enquanto roda, e só um
+# lease vencido (o processo que o pegou morreu) devolve o job para a fila.
+
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "memory")  # memory | sqlite
+JOBS_SQLITE_PATH = os.getenv("JOBS_SQLITE_PATH", "jobs.sqlite3")
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_MAX_TENTATIVAS = int(os.getenv("JOBS_MAX_TENTATIVAS", "5"))
+JOBS_CHAVES_MAX = 100000  # chaves concluídas lembradas pelo backend em memória
+JOBS_LEASE = float(os.getenv("JOBS_LEASE", "60"))  # segundos sem renovação até outro processo retomar o job
+
+logger = logging.getLogger('soledevita.jobs')
+
+jobs_latencia = metrics.Histogram('jobs_latency_seconds', 'Tempo entre enfileirar e concluir', metrics.LATENCY_BUCKETS)
+jobs_duracao = metrics.Histogram('jobs_run_seconds', 'Tempo de execução do job', metrics.LATENCY_BUCKETS)
+jobs_total = metrics.CounterMetric('jobs_total', 'Jobs processados por resultado')
+metrics.registrar(jobs_latencia, jobs_duracao, jobs_total)
+
+
+class MemoryJobBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fila = []  # heap de (executar_em, seq, job)
+        self._seq = 0
+        self._chaves = set()
+        self._concluidas = deque()
+
+    def inserir(self, tipo, payload, chave, agora):
+        with self._lock:
+            if chave in self._chaves:
+                return False
+            self._chaves.add(chave)
+            self._seq += 1
+            job = {'id': self._seq, 'tipo': tipo, 'payload': payload, 'chave': chave,
+                   'tentativas': 0, 'criado_em': agora}
+            heapq.heappush(self._fila, (agora, self._seq, job))
+            return True
+
+    def proximo(self, agora):
+        with self._lock:
+            if self._fila and self._fila[0][0] <= agora:
+                return heapq.heappop(self._fila)[2]
+            return None
+
+    def concluir(self, job):
+        with self._lock:
+            self._concluidas.append(job['chave'])
+            while len(self._concluidas) > JOBS_CHAVES_MAX:
+                self._chaves.discard(self._concluidas.popleft())
+
+    def reagendar(self, job, quando):
+        with self._lock:
+            job['tentativas'] += 1
+            self._seq += 1
+            heapq.heappush(self._fila, (quando, self._seq, job))
+
+    def falhar(self, job, erro):
+        self.concluir(job)
+
+    def renovar(self, job, agora):
+        return True
+
+    def profundidade(self):
+        with self._lock:
+            return len(self._fila)
+
+
+class SQLiteJobBackend:
+    """Sobrevive a restart do processo: jobs pendentes continuam de onde pararam."""
+
+    def __init__(self, path=JOBS_SQLITE_PATH, lease=JOBS_LEASE):
+        self.path = path
+        self.lease = lease
+        self._local = threading.local()
+        self._lock = threading.Lock()  # um claim por vez dentro do processo
+        with self._conn() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tipo TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    chave TEXT NOT NULL UNIQUE,
+                    status TEXT NOT NULL DEFAULT 'pendente',
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    executar_em REAL NOT NULL,
+                    criado_em REAL NOT NULL,
+                    erro TEXT,
+                    dono TEXT,
+                    lease_ate REAL
+                )
+            ''')
+            colunas = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for coluna, tipo in (('dono', 'TEXT'), ('lease_ate', 'REAL')):
+                if coluna not in colunas:  # arquivo criado antes do lease
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {coluna} {tipo}')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_pendentes ON jobs (status, executar_em)')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def inserir(self, tipo, payload, chave, agora):
+        with self._conn() as conn:
+            cur = conn.execute('''
+                INSERT INTO jobs (tipo, payload, chave, executar_em, criado_em) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (chave) DO NOTHING
+            ''', (tipo, json.dumps(payload), chave, agora, agora))
+            return cur.rowcount == 1
+
+    _DISPONIVEL = "((status = 'pendente' AND executar_em <= ?) OR (status = 'rodando' AND lease_ate < ?))"
+
+    def proximo(self, agora):
+        # O lock só vale dentro do processo; outros workers usam o mesmo arquivo. O UPDATE
+        # condicional é o claim: se outro processo pegou o job entre o SELECT e o UPDATE, rowcount
+        # vem 0 e tentamos o próximo. Um job 'rodando' só volta a ser pego com o lease vencido.
+        dono = uuid.uuid4().hex
+        with self._lock:
+            while True:
+                with self._conn() as conn:
+                    row = conn.execute(f'''
+                        SELECT id, tipo, payload, chave, tentativas, criado_em FROM jobs
+                        WHERE {self._DISPONIVEL}
+                        ORDER BY executar_em LIMIT 1
+                    ''', (agora, agora)).fetchone()
+                    if row is None:
+                        return None
+                    cur = conn.execute(f'''
+                        UPDATE jobs SET status = 'rodando', dono = ?, lease_ate = ?
+                        WHERE id = ? AND {self._DISPONIVEL}
+                    ''', (dono, agora + self.lease, row[0], agora, agora))
+                if cur.rowcount == 1:
+                    break
+        return {'id': row[0], 'tipo': row[1], 'payload': json.loads(row[2]), 'chave': row[3],
+                'tentativas': row[4], 'criado_em': row[5], 'dono': dono}
+
+    def _finalizar(self, job, sql, params):
+        # só quem ainda tem o lease grava o resultado
+        with self._conn() as conn:
+            cur = conn.execute(sql + ' WHERE id = ? AND dono = ?', params + (job['id'], job['dono']))
+        if cur.rowcount == 0:
+            logger.warning('job %s: lease perdido, resultado descartado (outro processo retomou o job)', job['chave'])
+
+    def renovar(self, job, agora):
+        with self._conn() as conn:
+            cur = conn.execute("UPDATE jobs SET lease_ate = ? WHERE id = ? AND dono = ? AND status = 'rodando'",
+                               (agora + self.lease, job['id'], job['dono']))
+        return cur.rowcount == 1
+
+    def concluir(self, job):
+        self._finalizar(job, "UPDATE jobs SET status = 'concluido', erro = NULL, dono = NULL, lease_ate = NULL", ())
+
+    def reagendar(self, job, quando):
+        self._finalizar(job, '''
+            UPDATE jobs SET status = 'pendente', tentativas = tentativas + 1, executar_em = ?,
+                            dono = NULL, lease_ate = NULL
+        ''', (quando,))
+
+    def falhar(self, job, erro):
+        self._finalizar(job, "UPDATE jobs SET status = 'falhou', erro = ?, dono = NULL, lease_ate = NULL", (erro,))
+
+    def profundidade(self):
+        return self._conn().execute("SELECT count(*) FROM jobs WHERE status = 'pendente'").fetchone()[0]
+
+
+class JobQueue:
+    def __init__(self, backend, workers=JOBS_WORKERS, max_tentativas=JOBS_MAX_TENTATIVAS):
+        self.backend = backend
+        self.workers = workers
+        self.max_tentativas = max_tentativas
+        self._handlers = {}
+        self._acordar = threading.Condition()
+        self._threads = []
+        self._parar = threading.Event()
+        self._rodando = {}  # id do job -> job, para renovar o lease
+        self._rodando_lock = threading.Lock()
+
+    def handler(self, tipo):
+        def registrar(fn):
+            self._handlers[tipo] = fn
+            return fn
+        return registrar
+
+    def enfileirar(self, tipo, payload, chave):
+        if tipo not in self._handlers:
+            raise KeyError(f'job sem handler: {tipo}')
+        inserido = self.backend.inserir(tipo, payload, chave, time.time())
+        if inserido:
+            with self._acordar:
+                self._acordar.notify()
+        return inserido
+
+    def iniciar(self):
+        if self._threads:
+            return
+        self._parar.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f'jobs-{i}', daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._renovar_leases, name='jobs-lease', daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def parar(self, timeout=5):
+        self._parar.set()
+        with self._acordar:
+            self._acordar.notify_all()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def _loop(self):
+        while not self._parar.is_set():
+            job = self.backend.proximo(time.time())
+            if job is None:
+                with self._acordar:
+                    self._acordar.wait(1.0)
+                continue
+            with self._rodando_lock:
+                self._rodando[job['id']] = job
+            try:
+                self._executar(job)
+            finally:
+                with self._rodando_lock:
+                    self._rodando.pop(job['id'], None)
+
+    def _renovar_leases(self):
+        # um terço do lease: duas renovações podem falhar antes de outro processo retomar o job
+        while not self._parar.wait(JOBS_LEASE / 3):
+            with self._rodando_lock:
+                rodando = list(self._rodando.values())
+            for job in rodando:
+                try:
+                    if not self.backend.renovar(job, time.time()):
+                        logger.warning('job %s: lease perdido durante a execução', job['chave'])
+                except Exception:
+                    logger.exception('falha ao renovar o lease do job %s', job['chave'])
+
+    def _executar(self, job):
+        inicio = time.perf_counter()
+        try:
+            self._handlers[job['tipo']](**job['payload'])
+        except Exception as e:
+            duracao = time.perf_counter() - inicio
+            if job['tentativas'] + 1 >= self.max_tentativas:
+                logger.exception('job %s falhou de vez após %d tentativas', job['chave'], job['tentativas'] + 1)
+                self.backend.falhar(job, repr(e))
+                resultado = 'falhou'
+            else:
+                espera = min(2 ** job['tentativas'], 300)
+                logger.warning('job %s falhou (%r), nova tentativa em %ss', job['chave'], e, espera)
+                self.backend.reagendar(job, time.time() + espera)
+                resultado = 'retentativa'
+        else:
+            duracao = time.perf_counter() - inicio
+            self.backend.concluir(job)
+            resultado = 'ok'
+            with metrics._lock:
+                jobs_latencia.observe(time.time() - job['criado_em'], tipo=job['tipo'])
+        with metrics._lock:
+            jobs_duracao.observe(duracao, tipo=job['tipo'])
+            jobs_total.inc(tipo=job['tipo'], resultado=resultado)
+
+    def metricas(self):
+        return [
+            '# TYPE jobs_queue_depth gauge',
+            f'jobs_queue_depth {self.backend.profundidade()}',
+        ]
+
+
+def create_job_queue(backend=JOBS_BACKEND):
+    if backend == 'memory':
+        return JobQueue(MemoryJobBackend())
+    if backend == 'sqlite':
+        return JobQueue(SQLiteJobBackend())
+    raise ValueError("JOBS_BACKEND inválido: %r" % backend)
+
+
+job_queue = create_job_queue()
+metrics.registrar_coletor(job_queue.metricas)
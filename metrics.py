@@ -0,0 +1,219 @@
+from flask import g, request, Response, has_request_context, abort
+from collections import Counter
+from dotenv import load_dotenv
+import db_config
+import ipaddress
+import threading
+import psycopg2.extensions
+import logging
+import time
+import re
+import os
+
+load_dotenv()
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))  # 0 desliga o log de requests lentos
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))  # mesma query repetida N vezes num request
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # sem token, /metrics só responde para localhost
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger('soledevita.metrics')
+
+_ESPACOS = re.compile(r'\s+')
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}  # labels -> [contagens por bucket..., soma, total]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        serie = self._series.get(key)
+        if serie is None:
+            serie = self._series[key] = [0] * (len(self.buckets) + 2)
+        for i, limite in enumerate(self.buckets):
+            if value <= limite:
+                serie[i] += 1
+        serie[-2] += value
+        serie[-1] += 1
+
+    def render(self):
+        linhas = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for key, serie in sorted(self._series.items()):
+            for i, limite in enumerate(self.buckets):
+                linhas.append(f'{self.name}_bucket{_labels(key, le=limite)} {serie[i]}')
+            linhas.append(f'{self.name}_bucket{_labels(key, le="+Inf")} {serie[-1]}')
+            linhas.append(f'{self.name}_sum{_labels(key)} {serie[-2]}')
+            linhas.append(f'{self.name}_count{_labels(key)} {serie[-1]}')
+        return linhas
+
+
+class CounterMetric:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = Counter()
+
+    def inc(self, amount=1, **labels):
+        self._series[tuple(sorted(labels.items()))] += amount
+
+    def render(self):
+        linhas = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for key, valor in sorted(self._series.items()):
+            linhas.append(f'{self.name}{_labels(key)} {valor}')
+        return linhas
+
+
+def _labels(key, **extra):
+    pares = list(key) + list(extra.items())
+    if not pares:
+        return ''
+    corpo = ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pares)
+    return '{' + corpo + '}'
+
+
+_lock = threading.Lock()
+request_latency = Histogram('http_request_duration_seconds', 'Latência por endpoint', LATENCY_BUCKETS)
+request_queries = Histogram('http_request_db_queries', 'Queries por request', QUERY_COUNT_BUCKETS)
+query_latency = Histogram('db_query_duration_seconds', 'Latência por query', LATENCY_BUCKETS)
+slow_queries = CounterMetric('db_slow_queries_total', f'Queries acima de {SLOW_QUERY_MS:g}ms')
+n_plus_one = CounterMetric('db_n_plus_one_total', 'Requests que repetiram a mesma query')
+slow_requests = CounterMetric('http_slow_requests_total', 'Requests acima de SLOW_REQUEST_MS')
+request_pool_wait = Histogram('http_request_db_pool_wait_seconds', 'Espera por conexão do pool por request',
+                              LATENCY_BUCKETS)
+_metricas = [request_latency, request_queries, query_latency, slow_queries, n_plus_one, slow_requests,
+             request_pool_wait]
+_coletores = []  # funções que devolvem linhas prontas (gauges lidos na hora do scrape)
+
+
+def registrar(*metricas):
+    with _lock:
+        _metricas.extend(metricas)
+
+
+def registrar_coletor(fn):
+    _coletores.append(fn)
+
+
+def _normalizar(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    return _ESPACOS.sub(' ', query).strip()[:200]
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            _registrar_query(query, time.perf_counter() - inicio)
+
+
+def _registrar_query(query, duracao):
+    sql = _normalizar(query)
+    endpoint = request.endpoint if has_request_context() else None
+    with _lock:
+        query_latency.observe(duracao)
+        if duracao * 1000 >= SLOW_QUERY_MS:
+            slow_queries.inc(endpoint=endpoint or '-')
+    if duracao * 1000 >= SLOW_QUERY_MS:
+        logger.warning('query lenta (%.1fms) em %s: %s', duracao * 1000, endpoint or '-', sql)
+    if has_request_context():
+        g.setdefault('_metricas_queries', Counter())[sql] += 1
+
+
+def _inicio_request():
+    g._metricas_inicio = time.perf_counter()
+
+
+def _fim_request(response):
+    g._metricas_status = response.status_code
+    return response
+
+
+def _registrar_request(exc=None):
+    inicio = g.pop('_metricas_inicio', None)
+    if inicio is None:
+        return
+    duracao = time.perf_counter() - inicio
+    endpoint = request.endpoint or 'desconhecido'
+    status = g.pop('_metricas_status', 500)
+    queries = g.pop('_metricas_queries', Counter())
+    total_queries = sum(queries.values())
+    repetidas = [(sql, n) for sql, n in queries.items() if n >= N_PLUS_ONE_THRESHOLD]
+    espera = g.get('_db_espera', 0.0)  # somada por db_config.get_connection/get_replica_connection
+
+    with _lock:
+        request_latency.observe(duracao, endpoint=endpoint, method=request.method, status=status)
+        request_queries.observe(total_queries, endpoint=endpoint)
+        request_pool_wait.observe(espera, endpoint=endpoint)
+        if repetidas:
+            n_plus_one.inc(endpoint=endpoint)
+        if SLOW_REQUEST_MS and duracao * 1000 >= SLOW_REQUEST_MS:
+            slow_requests.inc(endpoint=endpoint)
+
+    for sql, n in repetidas:
+        logger.warning('possível N+1 em %s: %d execuções de %s', endpoint, n, sql)
+    if SLOW_REQUEST_MS and duracao * 1000 >= SLOW_REQUEST_MS:
+        logger.warning('request lento: %s %s %.1fms, %d queries, espera no pool %.1fms',
+                       request.method, request.path, duracao * 1000, total_queries, espera * 1000)
+
+
+def _render_pool():
+    # primário sem label (como antes das réplicas); cada réplica com pool="replica-N"
+    todos = [(nome, p.stats()) for nome, p in db_config.pools()]
+    linhas = []
+    for chave, nome, tipo in (('in_use', 'db_pool_in_use', 'gauge'),
+                              ('idle', 'db_pool_idle', 'gauge'),
+                              ('total', 'db_pool_total', 'gauge'),
+                              ('max', 'db_pool_max', 'gauge'),
+                              ('checkouts', 'db_pool_checkouts_total', 'counter'),
+                              ('waits', 'db_pool_waits_total', 'counter'),
+                              ('timeouts', 'db_pool_timeouts_total', 'counter'),
+                              ('wait_total_s', 'db_pool_wait_seconds_total', 'counter'),
+                              ('wait_max_s', 'db_pool_wait_max_seconds', 'gauge')):
+        linhas.append(f'# TYPE {nome} {tipo}')
+        for pool_nome, stats in todos:
+            rotulo = '' if pool_nome == 'primario' else f'{{pool="{pool_nome}"}}'
+            linhas.append(f'{nome}{rotulo} {stats[chave]}')
+    return linhas
+
+
+def _local(req):
+    # veio direto de loopback, sem passar por proxy (atrás de um proxy o remote_addr é o do proxy)
+    if 'X-Forwarded-For' in req.headers or 'Forwarded' in req.headers:
+        return False
+    try:
+        return ipaddress.ip_address(req.remote_addr or '').is_loopback
+    except ValueError:
+        return False
+
+
+def metrics_view():
+    # rotas, queries e o estado do pool não ficam públicos: token, ou só localhost
+    if METRICS_TOKEN:
+        if request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            abort(403)
+    elif not _local(request):
+        abort(403)
+    with _lock:
+        linhas = [linha for metrica in _metricas for linha in metrica.render()]
+    linhas.extend(_render_pool())
+    for coletor in _coletores:
+        linhas.extend(coletor())
+    return Response('\n'.join(linhas) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    db_config.cursor_factory = InstrumentedCursor
+    app.before_request(_inicio_request)
+    app.after_request(_fim_request)
+    app.teardown_request(_registrar_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
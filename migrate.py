@@ -0,0 +1,103 @@
+from db_config import Cursor
+import argparse
+import sys
+import os
+import re
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATIONS_LOCK = 7318001  # chave do pg_advisory_xact_lock: só um processo migra por vez
+
+_ARQUIVO = re.compile(r'^(\d+)_(\w+)\.sql$')
+_INDICE = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+ON\s+(\w+)',
+                     re.IGNORECASE)
+
+
+def listar_migrations():
+    migrations = []
+    for nome in sorted(os.listdir(MIGRATIONS_DIR)):
+        m = _ARQUIVO.match(nome)
+        if m:
+            with open(os.path.join(MIGRATIONS_DIR, nome), encoding='utf-8') as f:
+                migrations.append((int(m.group(1)), m.group(2), f.read()))
+    return migrations
+
+
+def indices_esperados():
+    # {nome_do_indice: tabela}, extraído dos próprios arquivos de migration
+    return {nome: tabela for _, _, sql in listar_migrations() for nome, tabela in _INDICE.findall(sql)}
+
+
+def _garantir_tabela(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            versao     INT PRIMARY KEY,
+            nome       TEXT NOT NULL,
+            aplicada_em TIMESTAMP NOT NULL DEFAULT now()
+        )
+    ''')
+
+
+def versoes_aplicadas():
+    with Cursor() as cursor:
+        _garantir_tabela(cursor)
+        cursor.execute('SELECT versao FROM schema_migrations')
+        return {row[0] for row in cursor.fetchall()}
+
+
+def upgrade(saida=print):
+    aplicadas = []
+    for versao, nome, sql in listar_migrations():
+        # cada migration na sua própria transação, junto com o registro da versão
+        with Cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATIONS_LOCK,))
+            _garantir_tabela(cursor)
+            cursor.execute('SELECT 1 FROM schema_migrations WHERE versao = %s', (versao,))
+            if cursor.fetchone():
+                continue
+            cursor.execute(sql)
+            cursor.execute('INSERT INTO schema_migrations (versao, nome) VALUES (%s, %s)', (versao, nome))
+        saida(f'aplicada {versao:03d}_{nome}')
+        aplicadas.append(versao)
+    return aplicadas
+
+
+def indices_faltando():
+    esperados = indices_esperados()
+    with Cursor(readonly=True) as cursor:
+        cursor.execute('''
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = current_schema() AND indexname = ANY(%s)
+        ''', (list(esperados),))
+        existentes = {row[0] for row in cursor.fetchall()}
+    return {nome: tabela for nome, tabela in esperados.items() if nome not in existentes}
+
+
+def status(saida=print):
+    aplicadas = versoes_aplicadas()
+    pendentes = 0
+    for versao, nome, _ in listar_migrations():
+        marca = 'x' if versao in aplicadas else ' '
+        pendentes += versao not in aplicadas
+        saida(f'[{marca}] {versao:03d}_{nome}')
+    faltando = indices_faltando()
+    for nome, tabela in sorted(faltando.items()):
+        saida(f'índice ausente: {nome} em {tabela}')
+    return pendentes, faltando
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrations do banco do Sole De Vita')
+    parser.add_argument('comando', choices=['upgrade', 'status', 'check'], nargs='?', default='upgrade')
+    args = parser.parse_args(argv)
+
+    if args.comando == 'upgrade':
+        upgrade()
+        return 0
+    pendentes, faltando = status()
+    if args.comando == 'check' and (pendentes or faltando):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+-- Schema base da aplicação (idempotente: pode rodar num banco já existente)
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+CREATE TABLE IF NOT EXISTS tipos (
+    tipo_id   SERIAL PRIMARY KEY,
+    tipo_nome TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS produtos (
+    produto_id        SERIAL PRIMARY KEY,
+    produto_nome      TEXT NOT NULL,
+    produto_preco     NUMERIC(10, 2) NOT NULL,
+    produto_desc      TEXT,
+    produto_tipo      INT REFERENCES tipos (tipo_id),
+    produto_avaliacao NUMERIC(3, 1)
+);
+
+CREATE TABLE IF NOT EXISTS produtos_delivery (
+    deliv_id        SERIAL PRIMARY KEY,
+    deliv_nome      TEXT NOT NULL,
+    deliv_desc      TEXT,
+    deliv_preco     NUMERIC(10, 2) NOT NULL,
+    deliv_tipo      INT REFERENCES tipos (tipo_id),
+    deliv_avaliacao NUMERIC(3, 1)
+);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    usuario_id       SERIAL PRIMARY KEY,
+    usuario_nome     TEXT NOT NULL,
+    usuario_email    TEXT NOT NULL,
+    usuario_senha    TEXT NOT NULL,
+    usuario_endereco TEXT
+);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    pedido_id         SERIAL PRIMARY KEY,
+    usuario_id        INT NOT NULL REFERENCES usuarios (usuario_id),
+    pedido_status     TEXT NOT NULL DEFAULT 'Em andamento',
+    pedido_prectotal  NUMERIC(10, 2),
+    pedido_endentrega TEXT,
+    pedido_data       TIMESTAMP NOT NULL DEFAULT now()
+);
+
+-- produto_id aponta para produtos ou produtos_delivery (ver finalizar_pedido), por isso sem FK
+CREATE TABLE IF NOT EXISTS itens_pedido (
+    itpedidos_id       SERIAL PRIMARY KEY,
+    pedido_id          INT NOT NULL REFERENCES pedidos (pedido_id) ON DELETE CASCADE,
+    produto_id         INT NOT NULL,
+    itpedidos_qtde     INT NOT NULL,
+    itpedidos_precouni NUMERIC(10, 2)
+);
+
+-- versão do cardápio compartilhada entre workers (catalog_cache)
+CREATE TABLE IF NOT EXISTS catalogo_versao (
+    id     INT PRIMARY KEY,
+    versao BIGINT NOT NULL
+);
+INSERT INTO catalogo_versao (id, versao) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
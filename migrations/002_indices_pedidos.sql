@@ -0,0 +1,11 @@
+-- Índices para a paginação por keyset de /admin/pedidos e /perfil/pedidos
+-- (ORDER BY pedido_data DESC, pedido_id DESC com filtros opcionais)
+
+CREATE INDEX IF NOT EXISTS idx_pedidos_data_id
+    ON pedidos (pedido_data DESC, pedido_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_pedidos_status_data_id
+    ON pedidos (pedido_status, pedido_data DESC, pedido_id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_pedidos_usuario_data_id
+    ON pedidos (usuario_id, pedido_data DESC, pedido_id DESC);
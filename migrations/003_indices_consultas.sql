@@ -0,0 +1,13 @@
+-- Índices para os caminhos de acesso mais usados pelas rotas
+
+-- login e cadastro buscam por e-mail; também garante e-mail único
+CREATE UNIQUE INDEX IF NOT EXISTS idx_usuarios_email
+    ON usuarios (usuario_email);
+
+-- etapas do delivery filtram por deliv_tipo
+CREATE INDEX IF NOT EXISTS idx_produtos_delivery_tipo
+    ON produtos_delivery (deliv_tipo);
+
+-- itens de um pedido
+CREATE INDEX IF NOT EXISTS idx_itens_pedido_pedido
+    ON itens_pedido (pedido_id);
@@ -0,0 +1,52 @@
+-- Origem de cada item do pedido: itens_pedido.produto_id aponta para produtos OU produtos_delivery
+ALTER TABLE itens_pedido ADD COLUMN IF NOT EXISTS itpedidos_origem TEXT NOT NULL DEFAULT 'cardapio';
+
+-- Itens antigos: é delivery se o id só existe em produtos_delivery, ou se existe nos dois
+-- e o preço unitário bate com o do delivery
+UPDATE itens_pedido i
+SET itpedidos_origem = 'delivery'
+FROM produtos_delivery d
+WHERE d.deliv_id = i.produto_id
+  AND (NOT EXISTS (SELECT 1 FROM produtos p WHERE p.produto_id = i.produto_id)
+       OR i.itpedidos_precouni = d.deliv_preco);
+
+-- Agregados de vendas mantidos incrementalmente no checkout (analytics.py)
+CREATE TABLE IF NOT EXISTS vendas_diarias (
+    dia     DATE PRIMARY KEY,
+    pedidos INT NOT NULL DEFAULT 0,
+    receita NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS vendas_produto (
+    origem     TEXT NOT NULL,
+    produto_id INT NOT NULL,
+    unidades   BIGINT NOT NULL DEFAULT 0,
+    receita    NUMERIC(14, 2) NOT NULL DEFAULT 0,
+    PRIMARY KEY (origem, produto_id)
+);
+
+CREATE TABLE IF NOT EXISTS vendas_tipo (
+    tipo_id  INT PRIMARY KEY,
+    unidades BIGINT NOT NULL DEFAULT 0,
+    receita  NUMERIC(14, 2) NOT NULL DEFAULT 0
+);
+
+-- Pedidos que já existiam: mesma agregação de analytics.recalcular(); daqui para frente o job soma cada pedido novo
+INSERT INTO vendas_diarias (dia, pedidos, receita)
+SELECT pedido_data::date, count(*), COALESCE(sum(pedido_prectotal), 0)
+FROM pedidos GROUP BY 1;
+
+WITH itens AS (
+    SELECT i.itpedidos_origem AS origem, i.produto_id, i.itpedidos_qtde AS qtde,
+           i.itpedidos_qtde * i.itpedidos_precouni AS receita,
+           CASE WHEN i.itpedidos_origem = 'delivery' THEN d.deliv_tipo ELSE p.produto_tipo END AS tipo_id
+    FROM itens_pedido i
+    LEFT JOIN produtos p ON i.itpedidos_origem = 'cardapio' AND p.produto_id = i.produto_id
+    LEFT JOIN produtos_delivery d ON i.itpedidos_origem = 'delivery' AND d.deliv_id = i.produto_id
+),
+por_produto AS (
+    INSERT INTO vendas_produto (origem, produto_id, unidades, receita)
+    SELECT origem, produto_id, sum(qtde), COALESCE(sum(receita), 0) FROM itens GROUP BY origem, produto_id
+)
+INSERT INTO vendas_tipo (tipo_id, unidades, receita)
+SELECT tipo_id, sum(qtde), COALESCE(sum(receita), 0) FROM itens WHERE tipo_id IS NOT NULL GROUP BY tipo_id;
@@ -0,0 +1,9 @@
+-- Pedidos já somados nos agregados de vendas: o job de analytics pode rodar de novo sem contar duas vezes
+CREATE TABLE IF NOT EXISTS vendas_pedidos_registrados (
+    pedido_id INT PRIMARY KEY REFERENCES pedidos (pedido_id) ON DELETE CASCADE
+);
+
+-- os pedidos anteriores a esta migration já foram somados pela carga inicial da 004
+INSERT INTO vendas_pedidos_registrados (pedido_id)
+SELECT pedido_id FROM pedidos
+ON CONFLICT (pedido_id) DO NOTHING;
@@ -0,0 +1,6 @@
+-- Token de idempotência do checkout: o mesmo envio (duplo clique, retentativa, duas abas)
+-- nunca cria dois pedidos
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS pedido_token UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_pedidos_token
+    ON pedidos (pedido_token);
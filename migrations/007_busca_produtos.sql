@@ -0,0 +1,11 @@
+-- Busca textual no banco (BUSCA_BACKEND=postgres): nome + descrição sem acento, índice GIN.
+-- unaccent() não é IMMUTABLE; a função com o dicionário explícito pode ser, e entra no índice.
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+CREATE OR REPLACE FUNCTION busca_texto(nome TEXT, descricao TEXT) RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT to_tsvector('simple', lower(unaccent('unaccent'::regdictionary, coalesce(nome, '') || ' ' || coalesce(descricao, ''))))
+$$;
+
+CREATE INDEX IF NOT EXISTS idx_produtos_busca
+    ON produtos USING gin (busca_texto(produto_nome, produto_desc));
@@ -0,0 +1,14 @@
+-- Carrinhos do CART_BACKEND=postgres (cart_store.PostgresCartStore)
+CREATE TABLE IF NOT EXISTS carrinho_itens (
+    cart_id    TEXT NOT NULL,
+    chave      TEXT NOT NULL,
+    item       JSONB NOT NULL,
+    quantidade INT NOT NULL,
+    linha_id   BIGSERIAL,
+    atualizado TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (cart_id, chave)
+);
+
+-- limpeza dos carrinhos abandonados (atualizado < now() - CART_TTL)
+CREATE INDEX IF NOT EXISTS idx_carrinho_itens_atualizado
+    ON carrinho_itens (atualizado);
@@ -0,0 +1,164 @@
+from db_config import Cursor, USER, PASSWORD, HOST, PORT, DBNAME
+from pedidos import itens_json
+import threading
+import asyncio
+import psycopg2
+import select
+import queue
+import json
+import time
+
+CANAL_PEDIDOS = 'pedidos'
+
+_SQL_PEDIDO = f'''
+    SELECT p.pedido_id, u.usuario_nome, p.pedido_status,
+           p.pedido_prectotal, p.pedido_endentrega, p.pedido_data, {itens_json('p.')}
+    FROM pedidos p
+    JOIN usuarios u ON p.usuario_id = u.usuario_id
+    WHERE p.pedido_id = %s
+'''
+
+
+def _pedido(row):
+    if not row:
+        return None
+    return {
+        'id': row[0],
+        'cliente': row[1],
+        'status': row[2],
+        'total': float(row[3] or 0),
+        'endereco': row[4],
+        'data': row[5].isoformat() if row[5] else None,
+        'itens': row[6]
+    }
+
+
+def formatar_evento(evento):
+    # uma mensagem Server-Sent Events
+    return f"event: {evento['evento']}\ndata: {json.dumps(evento['pedido'])}\n\n"
+
+
+def notificar_pedido(cursor, pedido_id, evento):
+    # Entregue pelo Postgres só quando a transação do pedido fizer commit
+    cursor.execute('SELECT pg_notify(%s, %s)',
+                   (CANAL_PEDIDOS, json.dumps({'pedido_id': pedido_id, 'evento': evento})))
+
+
+class OrderFeed:
+    """Um único LISTEN no banco repassado para todos os painéis conectados."""
+
+    def __init__(self, fila_max=100):
+        self.fila_max = fila_max
+        self._lock = threading.Lock()
+        self._inscritos = set()
+        self._thread = None
+
+    def inscrever(self):
+        fila = queue.Queue(maxsize=self.fila_max)
+        with self._lock:
+            self._inscritos.add(fila)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._escutar, name='order-feed', daemon=True)
+                self._thread.start()
+        return fila
+
+    def cancelar(self, fila):
+        with self._lock:
+            self._inscritos.discard(fila)
+
+    def publicar(self, evento):
+        with self._lock:
+            inscritos = list(self._inscritos)
+        for fila in inscritos:
+            try:
+                fila.put_nowait(evento)
+            except queue.Full:
+                pass  # painel lento perde o evento, mas não trava os outros
+
+    def _buscar_pedido(self, pedido_id):
+        # logo depois do NOTIFY do primário: numa réplica atrasada o pedido ainda não existe
+        with Cursor(readonly=True, replica=False) as cursor:
+            cursor.execute(_SQL_PEDIDO, (pedido_id,))
+            return _pedido(cursor.fetchone())
+
+    def _escutar(self):
+        while True:
+            with self._lock:
+                if not self._inscritos:
+                    self._thread = None
+                    return
+            try:
+                conn = psycopg2.connect(user=USER, password=PASSWORD, host=HOST, port=PORT, dbname=DBNAME)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute('LISTEN ' + CANAL_PEDIDOS)
+                try:
+                    self._loop(conn)
+                finally:
+                    conn.close()
+            except psycopg2.Error:
+                time.sleep(2)  # banco fora do ar: tenta reconectar
+
+    def _loop(self, conn):
+        while True:
+            with self._lock:
+                if not self._inscritos:
+                    return
+            if select.select([conn], [], [], 5) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                aviso = conn.notifies.pop(0)
+                dados = json.loads(aviso.payload)
+                pedido = self._buscar_pedido(dados['pedido_id'])
+                if pedido:
+                    self.publicar({'evento': dados['evento'], 'pedido': pedido})
+
+
+class OrderFeedAsync:
+    """O mesmo feed para o modo ASGI: um LISTEN assíncrono e uma asyncio.Queue por painel."""
+
+    def __init__(self, fila_max=100):
+        self.fila_max = fila_max
+        self._inscritos = set()
+        self._tarefa = None
+
+    def inscrever(self):
+        fila = asyncio.Queue(maxsize=self.fila_max)
+        self._inscritos.add(fila)
+        if self._tarefa is None or self._tarefa.done():
+            self._tarefa = asyncio.ensure_future(self._escutar())
+        return fila
+
+    def cancelar(self, fila):
+        self._inscritos.discard(fila)
+
+    def publicar(self, evento):
+        for fila in list(self._inscritos):
+            try:
+                fila.put_nowait(evento)
+            except asyncio.QueueFull:
+                pass
+
+    async def _escutar(self):
+        import psycopg
+        import db_async
+
+        while self._inscritos:
+            try:
+                async with await psycopg.AsyncConnection.connect(db_async.CONNINFO, autocommit=True) as conn:
+                    await conn.execute('LISTEN ' + CANAL_PEDIDOS)
+                    while self._inscritos:
+                        async for aviso in conn.notifies(timeout=5):
+                            dados = json.loads(aviso.payload)
+                            async with db_async.Cursor(readonly=True, replica=False) as cursor:
+                                await cursor.execute(_SQL_PEDIDO, (dados['pedido_id'],))
+                                pedido = _pedido(await cursor.fetchone())
+                            if pedido:
+                                self.publicar({'evento': dados['evento'], 'pedido': pedido})
+            except psycopg.Error:
+                await asyncio.sleep(2)
+
+
+order_feed = OrderFeed()
+order_feed_async = OrderFeedAsync()
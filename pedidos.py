@@ -0,0 +1,24 @@
+# Itens de pedido com o nome resolvido pela origem de cada linha (itens_pedido.produto_id aponta
+# para produtos ou produtos_delivery, conforme itpedidos_origem). Entra como coluna no SELECT dos
+# pedidos: uma página de pedidos com todos os itens sai numa query só, usando idx_itens_pedido_pedido.
+
+_ITENS_JSON = '''
+    COALESCE((
+        SELECT json_agg(json_build_object(
+                   'origem', i.itpedidos_origem,
+                   'produto_id', i.produto_id,
+                   'nome', COALESCE(pr.produto_nome, d.deliv_nome),
+                   'qtde', i.itpedidos_qtde,
+                   'preco', i.itpedidos_precouni
+               ) ORDER BY i.itpedidos_id)
+        FROM itens_pedido i
+        LEFT JOIN produtos pr ON i.itpedidos_origem = 'cardapio' AND pr.produto_id = i.produto_id
+        LEFT JOIN produtos_delivery d ON i.itpedidos_origem = 'delivery' AND d.deliv_id = i.produto_id
+        WHERE i.pedido_id = {alias}pedido_id
+    ), '[]')
+'''
+
+
+def itens_json(alias=''):
+    # alias da tabela pedidos na query de fora, ex.: 'p.'
+    return _ITENS_JSON.format(alias=alias)
@@ -0,0 +1,141 @@
+from dotenv import load_dotenv
+import multiprocessing
+import logging
+import sys
+import os
+
+load_dotenv()
+
+# Servidor de produção: python serve.py
+#
+# Gunicorn com workers gthread. Cada worker importa o app depois do fork (sem preload), então
+# pool, cache do catálogo e threads de jobs são do próprio worker. Uma requisição segura no
+# máximo uma conexão (db_config guarda em g), por isso SERVE_THREADS começa igual a DB_POOL_MAX:
+# mais threads que conexões só trocam espera na fila do socket por espera no pool.
+# Conexões no banco = SERVE_WORKERS * DB_POOL_MAX.
+#
+# Cada painel aberto em /admin/pedidos/stream prende uma thread gthread enquanto estiver aberto
+# (sem conexão do pool: o feed escuta numa conexão própria). O gthread não separa threads por rota:
+# SERVE_THREADS_FEED só aumenta o pool de cada worker, uma folga para até esse número de painéis
+# abertos sem reduzir as SERVE_THREADS disponíveis para as outras requisições. Mais painéis que isso
+# voltam a ocupar threads das requisições normais.
+#
+# Com mais de um worker o carrinho não pode ficar na memória de cada processo: sem CART_BACKEND
+# definido, o serve.py usa postgres (tabela da migration 008); CART_BACKEND=memory explícito com
+# SERVE_WORKERS > 1 não sobe. Pelo mesmo motivo, sem cache compartilhado (SHARED_CACHE_BACKEND) a
+# invalidação do cardápio entre workers passa pelo poll de catalogo_versao: CATALOG_VERSION_POLL vira 2s
+# quando não definido, senão uma edição no admin só chegaria aos outros workers depois do TTL do cache.
+#
+# Reload sem derrubar conexões: kill -HUP $(cat soledevita.pid). O gunicorn sobe workers novos
+# (que abrem o pool e aquecem o catálogo antes de aceitar requisições) e encerra os antigos
+# depois que terminam o que estão atendendo, até SERVE_GRACEFUL_TIMEOUT.
+#
+# SERVE_MODE=asgi troca os workers gthread por workers uvicorn rodando asgi.application: leituras
+# quentes e o feed de pedidos no event loop (pool psycopg 3, DB_ASYNC_POOL_MAX), o resto do app
+# numa pool de ASGI_THREADS threads. Mesmo bind, pidfile, reload e aquecimento.
+
+SERVE_MODE = os.getenv("SERVE_MODE", "wsgi")  # wsgi | asgi
+SERVE_BIND = os.getenv("SERVE_BIND", "0.0.0.0:8000")
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(multiprocessing.cpu_count())))
+SERVE_THREADS = int(os.getenv("SERVE_THREADS", os.getenv("DB_POOL_MAX", "10")))
+SERVE_THREADS_FEED = int(os.getenv("SERVE_THREADS_FEED", "4"))  # painéis de pedidos abertos por worker
+SERVE_TIMEOUT = int(os.getenv("SERVE_TIMEOUT", "30"))
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+SERVE_MAX_REQUESTS = int(os.getenv("SERVE_MAX_REQUESTS", "0"))  # 0: worker não é reciclado
+SERVE_PIDFILE = os.getenv("SERVE_PIDFILE", "soledevita.pid")
+
+logger = logging.getLogger('soledevita.serve')
+
+
+def aquecer():
+    # Carrega o catálogo e renderiza o cardápio uma vez: a primeira requisição real já pega cache
+    from catalog_cache import catalog_cache
+    from app import app
+    import catalogo
+    import combos
+
+    catalog_cache.get_or_load('cardapio', catalogo.listar_produtos)
+    combos.indice_delivery()
+    with app.test_client() as cliente:
+        cliente.get('/cardapio')
+
+
+def post_worker_init(worker):
+    # roda no worker, depois do fork e antes de aceitar conexões
+    import db_config
+    try:
+        db_config.db_pool.abrir()
+        aquecer()
+    except Exception:
+        # banco fora do ar não impede o worker de subir; o pool conecta sob demanda depois
+        worker.log.exception("falha ao aquecer o worker %s", worker.pid)
+    worker.log.info("worker %s pronto: %s threads (+%s feed), pool %s", worker.pid, SERVE_THREADS,
+                    SERVE_THREADS_FEED, db_config.db_pool.stats())
+
+
+def worker_exit(server, worker):
+    import db_config
+    from jobs import job_queue
+    job_queue.parar()
+    for _, p in db_config.pools():
+        p.closeall()
+
+
+def main():
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        sys.exit('gunicorn não instalado: pip install gunicorn')
+    if SERVE_MODE not in ('wsgi', 'asgi'):
+        sys.exit('SERVE_MODE inválido: %r' % SERVE_MODE)
+
+    if SERVE_WORKERS > 1:
+        # lido pelos workers depois do fork, quando importam cart_store
+        backend = os.environ.setdefault("CART_BACKEND", "postgres")
+        if backend == 'memory':
+            sys.exit('CART_BACKEND=memory com SERVE_WORKERS=%s: cada worker teria seus próprios carrinhos; '
+                     'use CART_BACKEND=postgres ou sqlite, ou SERVE_WORKERS=1' % SERVE_WORKERS)
+        if os.getenv("SHARED_CACHE_BACKEND", "memory") == 'memory':
+            os.environ.setdefault("CATALOG_VERSION_POLL", "2")
+
+    if os.getenv("ASSETS_AUTO_BUILD") == "1":
+        # uma vez aqui, antes dos workers; eles só leem o manifest
+        import assets
+        assets.build(saida=logger.info)
+        os.environ["ASSETS_AUTO_BUILD"] = "0"
+
+    pool_max = int(os.getenv("DB_POOL_MAX", "10"))
+    if SERVE_THREADS > pool_max:
+        logger.warning("SERVE_THREADS=%s maior que DB_POOL_MAX=%s: threads extras vão esperar no pool",
+                       SERVE_THREADS, pool_max)
+
+    class Servidor(BaseApplication):
+        def load_config(self):
+            for chave, valor in {
+                'bind': SERVE_BIND,
+                'workers': SERVE_WORKERS,
+                'worker_class': 'gthread' if SERVE_MODE == 'wsgi' else 'uvicorn.workers.UvicornWorker',
+                'threads': SERVE_THREADS + SERVE_THREADS_FEED,
+                'timeout': SERVE_TIMEOUT,
+                'graceful_timeout': SERVE_GRACEFUL_TIMEOUT,
+                'max_requests': SERVE_MAX_REQUESTS,
+                'max_requests_jitter': SERVE_MAX_REQUESTS // 10,
+                'pidfile': SERVE_PIDFILE,
+                'preload_app': False,
+                'post_worker_init': post_worker_init,
+                'worker_exit': worker_exit,
+            }.items():
+                self.cfg.set(chave, valor)
+
+        def load(self):
+            if SERVE_MODE == 'asgi':
+                from asgi import application
+                return application
+            from app import app
+            return app
+
+    Servidor().run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,468 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+import socketserver
+import ipaddress
+import threading
+import logging
+import socket
+import pickle
+import hmac
+import struct
+import time
+import sys
+import os
+
+load_dotenv()
+
+# Cache compartilhado entre os nós: LRU em memória na frente de um store de rede.
+#
+#   chave completa: <namespace>:<versão do namespace>:<chave>
+#   invalidate(ns) só incrementa a versão; as entradas antigas expiram sozinhas no store.
+#
+# Stores: memory (só o processo, o padrão), tcp (SHARED_CACHE_ADDR, servidor de referência em
+# "python shared_cache.py servir", para desenvolvimento e testes) e redis (SHARED_CACHE_REDIS_URL).
+# Valores vão em pickle: o store deve ficar numa rede confiável. O servidor TCP só aceita bind em
+# loopback; para escutar na rede é preciso SHARED_CACHE_SEGREDO (o mesmo em servidor e clientes),
+# e aí cada mensagem vai assinada com HMAC e nada é deserializado sem a assinatura conferir.
+
+SHARED_CACHE_BACKEND = os.getenv("SHARED_CACHE_BACKEND", "memory")  # memory | tcp | redis
+SHARED_CACHE_ADDR = os.getenv("SHARED_CACHE_ADDR", "127.0.0.1:7070")
+SHARED_CACHE_REDIS_URL = os.getenv("SHARED_CACHE_REDIS_URL", "redis://localhost:6379/0")
+SHARED_CACHE_LOCAL_MAX = int(os.getenv("SHARED_CACHE_LOCAL_MAX", "1024"))
+SHARED_CACHE_LOCAL_TTL = float(os.getenv("SHARED_CACHE_LOCAL_TTL", "2"))  # atraso máximo de uma invalidação remota
+SHARED_CACHE_TIMEOUT = float(os.getenv("SHARED_CACHE_TIMEOUT", "0.5"))
+SHARED_CACHE_LOCK_TTL = float(os.getenv("SHARED_CACHE_LOCK_TTL", "10"))  # trava de single-flight entre nós
+SHARED_CACHE_SEGREDO = os.getenv("SHARED_CACHE_SEGREDO", "").encode() or None
+
+logger = logging.getLogger('soledevita.shared_cache')
+
+_AUSENTE = object()
+
+
+class StoreIndisponivel(Exception):
+    pass
+
+
+class MemoryStore:
+    """Dicionário com TTL. É também o que o servidor TCP guarda."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = {}  # chave -> (expira_em, valor)
+
+    def _vivo(self, chave, agora):
+        entrada = self._dados.get(chave)
+        if entrada is None:
+            return None
+        if entrada[0] and entrada[0] <= agora:
+            del self._dados[chave]
+            return None
+        return entrada
+
+    def get_many(self, chaves):
+        agora = time.monotonic()
+        with self._lock:
+            return {c: e[1] for c in chaves for e in [self._vivo(c, agora)] if e is not None}
+
+    def set_many(self, itens, ttl):
+        expira = time.monotonic() + ttl if ttl else 0
+        with self._lock:
+            for chave, valor in itens.items():
+                self._dados[chave] = (expira, valor)
+
+    def add(self, chave, valor, ttl):
+        agora = time.monotonic()
+        with self._lock:
+            if self._vivo(chave, agora) is not None:
+                return False
+            self._dados[chave] = (agora + ttl if ttl else 0, valor)
+            return True
+
+    def incr(self, chave, ttl):
+        agora = time.monotonic()
+        with self._lock:
+            entrada = self._vivo(chave, agora)
+            if entrada is None:
+                entrada = (agora + ttl if ttl else 0, 0)
+            self._dados[chave] = (entrada[0], entrada[1] + 1)
+            return entrada[1] + 1
+
+    def delete(self, chaves):
+        with self._lock:
+            for chave in chaves:
+                self._dados.pop(chave, None)
+
+    def limpar_expirados(self):
+        agora = time.monotonic()
+        with self._lock:
+            for chave in [c for c, e in self._dados.items() if e[0] and e[0] <= agora]:
+                del self._dados[chave]
+
+
+def _assinatura(segredo, dados):
+    return hmac.new(segredo, dados, 'sha256').digest()
+
+
+def _enviar(sock, objeto, segredo=None):
+    # quadro: tamanho (4 bytes) [+ HMAC-SHA256 (32 bytes)] + pickle
+    dados = pickle.dumps(objeto, protocol=pickle.HIGHEST_PROTOCOL)
+    assinatura = _assinatura(segredo, dados) if segredo else b''
+    sock.sendall(struct.pack('!I', len(dados)) + assinatura + dados)
+
+
+def _receber(sock, segredo=None):
+    tamanho = struct.unpack('!I', _ler(sock, 4))[0]
+    assinatura = _ler(sock, 32) if segredo else None
+    dados = _ler(sock, tamanho)
+    if segredo and not hmac.compare_digest(assinatura, _assinatura(segredo, dados)):
+        raise ConnectionError('assinatura inválida')
+    return pickle.loads(dados)
+
+
+def _ler(sock, tamanho):
+    partes = bytearray()
+    while len(partes) < tamanho:
+        pedaco = sock.recv(tamanho - len(partes))
+        if not pedaco:
+            raise ConnectionError('conexão fechada')
+        partes += pedaco
+    return bytes(partes)
+
+
+class TCPStore:
+    """Cliente do servidor TCP de referência: uma conexão por thread, (operação, args) -> resultado."""
+
+    OPERACOES = ('get_many', 'set_many', 'add', 'incr', 'delete')
+
+    def __init__(self, endereco=SHARED_CACHE_ADDR, timeout=SHARED_CACHE_TIMEOUT, segredo=SHARED_CACHE_SEGREDO):
+        host, porta = endereco.rsplit(':', 1)
+        self.endereco = (host, int(porta))
+        self.timeout = timeout
+        self.segredo = segredo
+        self._local = threading.local()
+
+    def _chamar(self, operacao, *args):
+        sock = getattr(self._local, 'sock', None)
+        try:
+            if sock is None:
+                sock = self._local.sock = socket.create_connection(self.endereco, timeout=self.timeout)
+            _enviar(sock, (operacao, args), self.segredo)
+            ok, resultado = _receber(sock, self.segredo)
+        except (OSError, EOFError, pickle.PickleError) as e:
+            self._local.sock = None
+            if sock is not None:
+                sock.close()
+            raise StoreIndisponivel(e)
+        if not ok:
+            raise StoreIndisponivel(resultado)
+        return resultado
+
+    def __getattr__(self, nome):
+        if nome not in self.OPERACOES:
+            raise AttributeError(nome)
+        return lambda *args: self._chamar(nome, *args)
+
+
+class RedisStore:
+    def __init__(self, url=SHARED_CACHE_REDIS_URL, timeout=SHARED_CACHE_TIMEOUT):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self._erros = redis.RedisError
+
+    def _chamar(self, fn):
+        try:
+            return fn()
+        except self._erros as e:
+            raise StoreIndisponivel(e)
+
+    def get_many(self, chaves):
+        valores = self._chamar(lambda: self._redis.mget(chaves)) if chaves else []
+        # contadores (incr) ficam como inteiro puro no redis; o resto é pickle
+        return {c: int(v) if v.isdigit() else pickle.loads(v) for c, v in zip(chaves, valores) if v is not None}
+
+    def set_many(self, itens, ttl):
+        def executar():
+            pipe = self._redis.pipeline(transaction=False)
+            for chave, valor in itens.items():
+                pipe.set(chave, pickle.dumps(valor, protocol=pickle.HIGHEST_PROTOCOL), px=int(ttl * 1000) or None)
+            pipe.execute()
+        self._chamar(executar)
+
+    def add(self, chave, valor, ttl):
+        return bool(self._chamar(lambda: self._redis.set(chave, pickle.dumps(valor), nx=True,
+                                                         px=int(ttl * 1000) or None)))
+
+    def incr(self, chave, ttl):
+        def executar():
+            valor = self._redis.incr(chave)
+            if valor == 1 and ttl:
+                self._redis.pexpire(chave, int(ttl * 1000))
+            return valor
+        return self._chamar(executar)
+
+    def delete(self, chaves):
+        if chaves:
+            self._chamar(lambda: self._redis.delete(*chaves))
+
+
+class SharedCache:
+    def __init__(self, store, local_max=SHARED_CACHE_LOCAL_MAX, local_ttl=SHARED_CACHE_LOCAL_TTL,
+                 lock_ttl=SHARED_CACHE_LOCK_TTL):
+        self.store = store
+        self.local_max = local_max
+        self.local_ttl = local_ttl
+        self.lock_ttl = lock_ttl
+        self._lock = threading.Lock()
+        self._local = OrderedDict()  # chave completa -> (expira_em, valor)
+        self._versoes = {}  # namespace -> (expira_em, versão)
+        self._carregando = {}  # chave completa -> threading.Lock (single-flight dentro do processo)
+        self.hits_local = 0
+        self.hits_store = 0
+        self.misses = 0
+
+    @property
+    def distribuido(self):
+        return not isinstance(self.store, MemoryStore)
+
+    # namespaces
+
+    def versao(self, ns):
+        agora = time.monotonic()
+        with self._lock:
+            atual = self._versoes.get(ns)
+            if atual and atual[0] > agora:
+                return atual[1]
+        try:
+            versao = self.store.get_many(['ns:' + ns]).get('ns:' + ns, 0)
+        except StoreIndisponivel:
+            versao = atual[1] if atual else 0
+        with self._lock:
+            self._versoes[ns] = (agora + self.local_ttl, versao)
+        return versao
+
+    def chave(self, ns, chave, versao=None):
+        return f'{ns}:{self.versao(ns) if versao is None else versao}:{chave}'
+
+    def invalidate(self, ns):
+        try:
+            versao = self.store.incr('ns:' + ns, 0)
+        except StoreIndisponivel:
+            logger.warning('store indisponível: invalidação de %s só vale neste processo', ns)
+            versao = self.versao(ns) + 1
+        with self._lock:
+            self._versoes[ns] = (time.monotonic() + self.local_ttl, versao)
+            prefixo = f'{ns}:'
+            for chave in [c for c in self._local if c.startswith(prefixo)]:
+                del self._local[chave]
+
+    # LRU local
+
+    def _local_get(self, completa, agora):
+        entrada = self._local.get(completa)
+        if entrada is None:
+            return _AUSENTE
+        if entrada[0] <= agora:
+            del self._local[completa]
+            return _AUSENTE
+        self._local.move_to_end(completa)
+        return entrada[1]
+
+    def _local_set(self, completa, valor, ttl):
+        # localmente nunca além de local_ttl: é o que limita a defasagem entre nós
+        self._local[completa] = (time.monotonic() + min(ttl or self.local_ttl, self.local_ttl), valor)
+        self._local.move_to_end(completa)
+        while len(self._local) > self.local_max:
+            self._local.popitem(last=False)
+
+    # leitura e escrita em lote
+
+    def get_many(self, ns, chaves):
+        versao = self.versao(ns)
+        agora = time.monotonic()
+        resultado, faltando = {}, {}
+        with self._lock:
+            for chave in chaves:
+                completa = self.chave(ns, chave, versao)
+                valor = self._local_get(completa, agora)
+                if valor is _AUSENTE:
+                    faltando[completa] = chave
+                else:
+                    resultado[chave] = valor
+                    self.hits_local += 1
+        if faltando:
+            try:
+                remotos = self.store.get_many(list(faltando))
+            except StoreIndisponivel:
+                remotos = {}
+            with self._lock:
+                for completa, valor in remotos.items():
+                    self._local_set(completa, valor, self.local_ttl)
+                    resultado[faltando[completa]] = valor
+                self.hits_store += len(remotos)
+                self.misses += len(faltando) - len(remotos)
+        return resultado
+
+    def set_many(self, ns, itens, ttl):
+        versao = self.versao(ns)
+        completos = {self.chave(ns, chave, versao): valor for chave, valor in itens.items()}
+        with self._lock:
+            for completa, valor in completos.items():
+                self._local_set(completa, valor, ttl)
+        try:
+            self.store.set_many(completos, ttl)
+        except StoreIndisponivel:
+            pass  # fica só no LRU local
+
+    def get(self, ns, chave, default=None):
+        return self.get_many(ns, [chave]).get(chave, default)
+
+    def set(self, ns, chave, valor, ttl):
+        self.set_many(ns, {chave: valor}, ttl)
+
+    def delete(self, ns, chave):
+        completa = self.chave(ns, chave)
+        with self._lock:
+            self._local.pop(completa, None)
+        try:
+            self.store.delete([completa])
+        except StoreIndisponivel:
+            pass
+
+    def incr(self, ns, chave, ttl):
+        # contador só no store (não passa pelo LRU local)
+        return self.store.incr(self.chave(ns, chave), ttl)
+
+    # single-flight
+
+    def get_or_load(self, ns, chave, loader, ttl, espera=None):
+        valor = self.get(ns, chave, _AUSENTE)
+        if valor is not _AUSENTE:
+            return valor
+
+        completa = self.chave(ns, chave)
+        with self._lock:
+            trava = self._carregando.setdefault(completa, threading.Lock())
+        # dentro do processo: só uma thread carrega, as outras esperam e leem o resultado
+        with trava:
+            try:
+                valor = self.get(ns, chave, _AUSENTE)
+                if valor is not _AUSENTE:
+                    return valor
+                # entre nós: quem pega a trava no store carrega; os outros esperam o valor aparecer
+                if not self._travar_remoto(completa):
+                    valor = self._esperar(ns, chave, self.lock_ttl if espera is None else espera)
+                    if valor is not _AUSENTE:
+                        return valor
+                try:
+                    valor = loader()
+                    self.set(ns, chave, valor, ttl)
+                finally:
+                    self._destravar_remoto(completa)
+                return valor
+            finally:
+                with self._lock:
+                    self._carregando.pop(completa, None)
+
+    def _travar_remoto(self, completa):
+        try:
+            return self.store.add('lock:' + completa, 1, self.lock_ttl)
+        except StoreIndisponivel:
+            return True
+
+    def _destravar_remoto(self, completa):
+        try:
+            self.store.delete(['lock:' + completa])
+        except StoreIndisponivel:
+            pass
+
+    def _esperar(self, ns, chave, limite):
+        fim = time.monotonic() + limite
+        intervalo = 0.01
+        while time.monotonic() < fim:
+            time.sleep(intervalo)
+            intervalo = min(intervalo * 2, 0.2)
+            try:
+                completa = self.chave(ns, chave)
+                encontrado = self.store.get_many([completa])
+            except StoreIndisponivel:
+                break
+            if completa in encontrado:
+                with self._lock:
+                    self._local_set(completa, encontrado[completa], self.local_ttl)
+                return encontrado[completa]
+        return _AUSENTE  # o outro nó demorou demais: carrega aqui mesmo
+
+    def stats(self):
+        with self._lock:
+            return {'local': len(self._local), 'hits_local': self.hits_local,
+                    'hits_store': self.hits_store, 'misses': self.misses}
+
+
+def create_shared_cache(backend=SHARED_CACHE_BACKEND):
+    if backend == 'memory':
+        return SharedCache(MemoryStore())
+    if backend == 'tcp':
+        return SharedCache(TCPStore())
+    if backend == 'redis':
+        return SharedCache(RedisStore())
+    raise ValueError("SHARED_CACHE_BACKEND inválido: %r" % backend)
+
+
+shared_cache = create_shared_cache()
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        store = self.server.store
+        segredo = self.server.segredo
+        while True:
+            try:
+                operacao, args = _receber(self.request, segredo)
+            except (ConnectionError, OSError, EOFError):
+                return
+            try:
+                if operacao not in TCPStore.OPERACOES:
+                    raise ValueError(operacao)
+                resposta = (True, getattr(store, operacao)(*args))
+            except Exception as e:
+                resposta = (False, repr(e))
+            _enviar(self.request, resposta, segredo)
+
+
+def _loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def servir(endereco=SHARED_CACHE_ADDR, segredo=SHARED_CACHE_SEGREDO):
+    host, porta = endereco.rsplit(':', 1)
+    if not segredo and not _loopback(host):
+        # qualquer um que alcance a porta mandaria um pickle para este processo deserializar
+        raise ValueError(f'{endereco} não é loopback: defina SHARED_CACHE_SEGREDO para servir na rede')
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    servidor = socketserver.ThreadingTCPServer((host, int(porta)), _Handler)
+    servidor.daemon_threads = True
+    servidor.store = MemoryStore()
+    servidor.segredo = segredo
+
+    def limpar():
+        while True:
+            time.sleep(30)
+            servidor.store.limpar_expirados()
+
+    threading.Thread(target=limpar, daemon=True).start()
+    return servidor
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['servir']:
+        sys.exit('uso: python shared_cache.py servir [host:porta]')
+    endereco = sys.argv[2] if len(sys.argv) > 2 else SHARED_CACHE_ADDR
+    try:
+        servidor = servir(endereco)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f'cache compartilhado em {endereco}')
+    servidor.serve_forever()
@@ -0,0 +1,113 @@
+# python -m unittest discover tests  (ou python -m pytest tests), a partir da raiz do projeto
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import unittest
+import time
+
+from shared_cache import MemoryStore, TCPStore, SharedCache, StoreIndisponivel, servir
+
+
+class ServidorTCP:
+    """Servidor de referência numa porta livre de loopback, numa thread."""
+
+    def __init__(self, segredo=None):
+        self.servidor = servir('127.0.0.1:0', segredo=segredo)
+        self.endereco = '127.0.0.1:%s' % self.servidor.server_address[1]
+        threading.Thread(target=self.servidor.serve_forever, daemon=True).start()
+
+    def fechar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+
+class Contador:
+    def __init__(self, valor, demora=0.1):
+        self.valor = valor
+        self.demora = demora
+        self.chamadas = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.chamadas += 1
+        time.sleep(self.demora)
+        return self.valor
+
+
+class TTLTest(unittest.TestCase):
+    def test_entrada_expira_no_store(self):
+        store = MemoryStore()
+        store.set_many({'a': 1}, 0.05)
+        self.assertEqual(store.get_many(['a']), {'a': 1})
+        time.sleep(0.1)
+        self.assertEqual(store.get_many(['a']), {})
+
+    def test_lru_local_nao_passa_do_ttl_do_store(self):
+        cache = SharedCache(MemoryStore(), local_ttl=60)
+        cache.set('ns', 'a', 1, ttl=0.05)
+        self.assertEqual(cache.get('ns', 'a'), 1)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get('ns', 'a'))
+
+
+class SingleFlightTest(unittest.TestCase):
+    def test_uma_carga_por_processo(self):
+        cache = SharedCache(MemoryStore())
+        carregar = Contador('cardapio')
+        with ThreadPoolExecutor(8) as executor:
+            valores = list(executor.map(lambda _: cache.get_or_load('ns', 'k', carregar, 60), range(8)))
+        self.assertEqual(valores, ['cardapio'] * 8)
+        self.assertEqual(carregar.chamadas, 1)
+
+    def test_uma_carga_entre_nos(self):
+        servidor = ServidorTCP()
+        self.addCleanup(servidor.fechar)
+        nos = [SharedCache(TCPStore(servidor.endereco), local_ttl=0) for _ in range(4)]
+        carregar = Contador('cardapio')
+        with ThreadPoolExecutor(len(nos)) as executor:
+            valores = list(executor.map(lambda no: no.get_or_load('ns', 'k', carregar, 60), nos))
+        self.assertEqual(valores, ['cardapio'] * len(nos))
+        self.assertEqual(carregar.chamadas, 1)
+
+
+class InvalidacaoTest(unittest.TestCase):
+    def setUp(self):
+        servidor = ServidorTCP()
+        self.addCleanup(servidor.fechar)
+        self.a = SharedCache(TCPStore(servidor.endereco), local_ttl=0)
+        self.b = SharedCache(TCPStore(servidor.endereco), local_ttl=0)
+
+    def test_invalidate_vale_para_os_outros_nos(self):
+        self.a.set('catalogo', 'cardapio', 'v1', 60)
+        self.a.set('outro', 'x', 'fica', 60)
+        self.assertEqual(self.b.get('catalogo', 'cardapio'), 'v1')
+
+        self.a.invalidate('catalogo')
+        self.assertIsNone(self.b.get('catalogo', 'cardapio'))
+        self.assertEqual(self.b.get('outro', 'x'), 'fica')
+
+    def test_recarrega_depois_de_invalidar(self):
+        self.assertEqual(self.b.get_or_load('catalogo', 'cardapio', lambda: 'v1', 60), 'v1')
+        self.a.invalidate('catalogo')
+        self.assertEqual(self.b.get_or_load('catalogo', 'cardapio', lambda: 'v2', 60), 'v2')
+
+
+class SegurancaTest(unittest.TestCase):
+    def test_recusa_bind_fora_do_loopback_sem_segredo(self):
+        with self.assertRaises(ValueError):
+            servir('0.0.0.0:0')
+
+    def test_mensagem_sem_assinatura_nao_e_aceita(self):
+        servidor = ServidorTCP(segredo=b'segredo')
+        self.addCleanup(servidor.fechar)
+        with self.assertRaises(StoreIndisponivel):
+            TCPStore(servidor.endereco, segredo=None).get_many(['a'])
+        with self.assertRaises(StoreIndisponivel):
+            TCPStore(servidor.endereco, segredo=b'outro').get_many(['a'])
+        assinado = TCPStore(servidor.endereco, segredo=b'segredo')
+        assinado.set_many({'a': 1}, 60)
+        self.assertEqual(assinado.get_many(['a']), {'a': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()